@@ -1,24 +1,136 @@
 import random
-from collections import deque, namedtuple, Counter
-from copy import deepcopy
-import tkinter as tk
-from tkinter import messagebox, filedialog
-import tkinter.simpledialog
+from collections import deque, namedtuple, Counter, OrderedDict
 import itertools as it
 from textwrap import wrap
 from enum import Enum
 import pickle
-from typing import List, Dict, Tuple, Callable, Set
+import json
+import hashlib
+import os
+import mmap
+import tempfile
+import sys
+import time
+import argparse
+import multiprocessing
+import threading
+from array import array
+from typing import List, Dict, Tuple, Callable, Set, Optional, Union, Iterable, Iterator, TextIO
+try:
+    import tkinter as tk
+    from tkinter import messagebox, filedialog
+    import tkinter.simpledialog
+    import tkinter.font
+except ImportError:
+    # Only the game needs tkinter, the commands run without it
+    tk = None
+try:
+    import numpy as np
+except ImportError:
+    # Only the batch candidate functions need numpy
+    np = None
 
 
 MARGIN =  20 # Pixels around the board
 SIDE = 50 # Height of each board cell
 WIDTH = HEIGHT = MARGIN * 2 + SIDE * 9 # Width and height of the whole board
+RESIZE_DELAY = 50 # Milliseconds the window size has to stay put before the board is rescaled
+HINT_POLL = 50 # Milliseconds between checks whether a background hint search is done
+CHAIN_LENGTH = 8 # Most strong links in a chain the hint engine looks for
+HINT_CACHE_SIZE = 256 # Positions the game remembers the hint of
+GENERATE_ATTEMPTS = 50 # Tries at making a puzzle without seeds before giving up, about 1 in 6 gets there
+CHUNKS_IN_FLIGHT = 4 # Chunks per worker process handed out ahead of the results read back
 # Highlight colours
 HLANSWER = "light goldenrod"
 HLCAND = "light blue"
 COLOURS = [None, "pale green", "sienna1", "khaki1", "sky blue", "mediumpurple1", "peachpuff2", "tomato", "sandy brown", "hot pink"]
 
+# Candidates are stored as 9 bit masks, bit (digit - 1) is set if the digit is a candidate
+ALL_DIGITS = 0x1FF
+DIGIT_BITS = tuple(0 if digit == 0 else 1 << (digit - 1) for digit in range(10))
+POPCOUNT = bytes(bin(mask).count("1") for mask in range(512))
+LOWEST_DIGIT = bytes((mask & -mask).bit_length() for mask in range(512))
+MASK_DIGITS = tuple(tuple(digit for digit in range(1, 10) if mask & DIGIT_BITS[digit]) for mask in range(512))
+# The same masks used for positions in a unit, bit n set for position n
+MASK_POSITIONS = tuple(tuple(position for position in range(9) if mask >> position & 1) for mask in range(512))
+# Fewest positions of the mask left over when the ones in one of the three
+# boxes along the line are taken out, those are where the fins of a fish can go
+OUTSIDE_FINS = bytes(min(POPCOUNT[mask & ~(0x7 << stack * 3)] for stack in range(3)) for mask in range(512))
+
+# Index tables for the board, cells are (row, col) and units are numbered
+# boxes 0-8, rows 9-17 and columns 18-26
+BOX_CELLS = tuple(
+    tuple((row, col) for row in range(box // 3 * 3, box // 3 * 3 + 3) for col in range(box % 3 * 3, box % 3 * 3 + 3))
+    for box in range(9)
+)
+ROW_CELLS = tuple(tuple((row, col) for col in range(9)) for row in range(9))
+COL_CELLS = tuple(tuple((row, col) for row in range(9)) for col in range(9))
+UNITS = BOX_CELLS + ROW_CELLS + COL_CELLS
+CELL_BOX = tuple(tuple(row // 3 * 3 + col // 3 for col in range(9)) for row in range(9))
+CELL_UNITS = tuple((CELL_BOX[row][col], 9 + row, 18 + col) for row in range(9) for col in range(9))
+PEERS = tuple(
+    tuple(sorted(set(cell for unit in CELL_UNITS[row * 9 + col] for cell in UNITS[unit]) - {(row, col)}))
+    for row in range(9) for col in range(9)
+)
+CELLS = tuple((row, col) for row in range(9) for col in range(9))
+UNIT_INDEXES = tuple(tuple(row * 9 + col for row, col in unit) for unit in UNITS)
+PEER_INDEXES = tuple(tuple(row * 9 + col for row, col in peers) for peers in PEERS)
+# Cells shared by a box and a row or column crossing it, keyed by (box unit, line unit)
+INTERSECTIONS = {
+    (box, line): frozenset(UNITS[box]).intersection(UNITS[line])
+    for box in range(9) for line in range(9, 27)
+    if frozenset(UNITS[box]).intersection(UNITS[line])
+}
+
+def empty_candidates() -> array:
+    return array('H', bytes(162))
+
+def digits_to_mask(digits) -> int:
+    mask = 0
+    for digit in digits:
+        mask |= DIGIT_BITS[digit]
+    return mask
+
+# Random 64 bit keys for hashing a position, one per cell and value and one per
+# cell and candidate. The seed is fixed so a position hashes the same everywhere.
+ZOBRIST_RANDOM = random.Random(81)
+ZOBRIST_VALUES = tuple(ZOBRIST_RANDOM.getrandbits(64) for key in range(810))
+ZOBRIST_CANDIDATES = tuple(ZOBRIST_RANDOM.getrandbits(64) for key in range(729))
+
+def zobrist_hash(puzzle: List[List[int]], candidates: array) -> int:
+    """
+    Hash of the values and candidates of a board, the keys of everything set
+    xored together. SudokuGame keeps it up to date with every change, so it
+    can be used to recognise a position that was seen before.
+    """
+    key = 0
+    for index in range(81):
+        value = puzzle[index // 9][index % 9]
+        if value != 0:
+            key ^= ZOBRIST_VALUES[index * 10 + value]
+        for digit in MASK_DIGITS[candidates[index]]:
+            key ^= ZOBRIST_CANDIDATES[index * 9 + digit - 1]
+    return key
+
+# Packed puzzles hold two cells per byte, the first one in the high nibble
+PACKED_SIZE = 41
+UNPACKED_PAIRS = tuple(bytes((byte >> 4, byte & 0xF)) for byte in range(256))
+TEXT_DIGITS = bytes.maketrans(bytes(range(10)), b"0123456789")
+
+def pack_puzzle(digits: bytes) -> bytes:
+    """
+    Packs 81 cell values (0 for empty) into 41 bytes
+    """
+    return bytes(high << 4 | low for high, low in zip(digits[0::2], digits[1::2] + b"\0"))
+
+def unpack_puzzle(packed: bytes) -> bytes:
+    return b"".join([UNPACKED_PAIRS[byte] for byte in packed])[:81]
+
+def parse_puzzle(puzzle_string: str) -> List[List[int]]:
+    rows = wrap(puzzle_string, 9)
+    rows = [row.replace('.', '0') for row in rows]
+    return [ [int(ch) for ch in row] for row in rows ]
+
 class Mode(Enum):
     solution = 1
     candidate = 2
@@ -29,10 +141,15 @@ class SudokuBoard(object):
     """
     Sudoku Board Representation
     """
-    def __init__(self, puzzle_string: str):
+    # Parsed seed files shared by every board in the process, file name to
+    # (mtime, puzzles packed as 81 bytes each with the digits 0-9)
+    seed_pools: Dict[str, Tuple[int, bytes]] = {}
+    SEED_DIGITS = bytes.maketrans(b".0123456789", bytes(1) + bytes(range(10)))
+
+    def __init__(self, puzzle_string: Union[str, bytes]):
         self.__create_board(puzzle_string)
 
-    def update(self, puzzle_string: str):
+    def update(self, puzzle_string: Union[str, bytes]):
         self.__create_board(puzzle_string)
 
     def get(self) -> List[List[int]]:
@@ -41,16 +158,81 @@ class SudokuBoard(object):
     def set_board(self, board: List[List[int]]):
         self.board = board
 
-    def __create_board(self, puzzle_string: str):
-        rows = wrap(puzzle_string, 9)
-        rows = [row.replace('.', '0') for row in rows]
-        self.board = [ [int(ch) for ch in row] for row in rows ]
+    def __create_board(self, puzzle: Union[str, bytes]):
+        if isinstance(puzzle, bytes) and len(puzzle) == PACKED_SIZE:
+            digits = unpack_puzzle(puzzle)
+            self.board = [list(digits[row * 9:row * 9 + 9]) for row in range(9)]
+        else:
+            self.board = parse_puzzle(puzzle)
 
-    def generate(self, difficulty: str):
-        file_name = difficulty + ".seed"
-        with open(file_name) as file:
-            puzzles = [line.strip() for line in file]
-            self.__create_board(random.choice(puzzles)) 
+    @classmethod
+    def get_seed_pool(cls, file_name: str) -> bytes:
+        """
+        The puzzles of a seed file, only read again when the file has changed
+        """
+        mtime = os.stat(file_name).st_mtime_ns
+        cached = cls.seed_pools.get(file_name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        pool = cls.read_seed_pool(file_name)
+        cls.seed_pools[file_name] = (mtime, pool)
+        return pool
+
+    @classmethod
+    def read_seed_pool(cls, file_name: str, strict: bool = False) -> bytes:
+        """
+        The puzzles of a collection packed as 81 bytes each, without caching
+        them. Blank lines are skipped and so are other lines that aren't a
+        puzzle, unless strict where they raise a ValueError instead.
+        """
+        if BinaryCollection.is_binary(file_name):
+            collection = BinaryCollection(file_name)
+            pool = b"".join(collection.get_digits(number) for number in range(len(collection)))
+            collection.close()
+            return pool
+        puzzles = []
+        with open(file_name, "rb") as file:
+            for line_number, line in enumerate(file, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                digits = line.translate(cls.SEED_DIGITS)
+                if len(digits) != 81 or max(digits) > 9:
+                    if strict:
+                        raise ValueError("{} line {} is not a puzzle of 81 cells".format(file_name, line_number))
+                    continue
+                puzzles.append(digits)
+        return b"".join(puzzles)
+
+    @staticmethod
+    def seed_file(difficulty: str) -> Optional[str]:
+        """
+        The .seed or .sdb file puzzles of the difficulty are made from, None
+        when there is neither.
+        """
+        for file_name in (difficulty + ".seed", difficulty + ".sdb"):
+            if os.path.exists(file_name):
+                return file_name
+        return None
+
+    def generate(self, difficulty: str) -> bool:
+        """
+        Sets up a random puzzle of the difficulty from its seeds. Without
+        seeds a new one is made, which can take several tries; False if none
+        of GENERATE_ATTEMPTS got there, the board is left as it was then.
+        """
+        file_name = self.seed_file(difficulty)
+        if file_name is None:
+            # No seeds to start from, make a new one instead
+            for attempt in range(GENERATE_ATTEMPTS):
+                result = generate_puzzle(difficulty)
+                if result is not None:
+                    self.__create_board(result[0])
+                    return True
+            return False
+        pool = self.get_seed_pool(file_name)
+        start = random.randrange(len(pool) // 81) * 81
+        self.board = [list(pool[start + row * 9:start + row * 9 + 9]) for row in range(9)]
 
         # Rotate puzzle between 0 to 3 times
         for i in range(random.randint(0,3)):
@@ -68,6 +250,7 @@ class SudokuBoard(object):
             self.flip_vert()
 
         self.translate()
+        return True
 
     def rotate90(self):
         new_board = [[0 for y in range(9)] for x in range(9)]
@@ -117,17 +300,592 @@ class SudokuBoard(object):
 
 
 
+class SudokuSolver(object):
+    """
+    Exact cover solver using Knuth's Dancing Links
+
+    The 324 constraint columns are: cell filled, digit in row, digit in column
+    and digit in box. Every one of the 729 possible placements covers one of
+    each, the givens are covered up front and the rest is searched.
+    """
+    __template = None
+
+    def __init__(self, puzzle: Union[str, SudokuBoard, List[List[int]]]):
+        if isinstance(puzzle, SudokuBoard):
+            puzzle = puzzle.get()
+        if isinstance(puzzle, str):
+            puzzle = parse_puzzle(puzzle)
+        self.givens = [puzzle[row][col] for row in range(9) for col in range(9)]
+        self.solution: Optional[str] = None
+        self.count = 0
+
+    def solve(self) -> Optional[str]:
+        """
+        Returns the (first found) solution as an 81 digit string, or None
+        """
+        self.__search(1)
+        return self.solution
+
+    def count_solutions(self, limit: int = 2) -> int:
+        """
+        Counts the solutions, but stops looking once limit is reached
+        """
+        self.__search(limit)
+        return self.count
+
+    def is_unique(self) -> bool:
+        return self.count_solutions(2) == 1
+
+    @classmethod
+    def __build_template(cls):
+        # Node 0 is the root, nodes 1-324 are the column headers and each
+        # placement (row, col, digit) gets four nodes after that
+        left = list(range(-1, 324))
+        right = list(range(1, 326))
+        left[0] = 324
+        right[324] = 0
+        up = list(range(325))
+        down = list(range(325))
+        column = list(range(325))
+        size = [0] * 325
+        placements = []
+        for row in range(9):
+            for col in range(9):
+                box = (row // 3) * 3 + col // 3
+                for digit in range(1, 10):
+                    first = len(left)
+                    placements.append(first)
+                    columns = (
+                        1 + row * 9 + col,
+                        82 + row * 9 + digit - 1,
+                        163 + col * 9 + digit - 1,
+                        244 + box * 9 + digit - 1,
+                    )
+                    for i, col_node in enumerate(columns):
+                        node = first + i
+                        left.append(first + (i + 3) % 4)
+                        right.append(first + (i + 1) % 4)
+                        up.append(up[col_node])
+                        down.append(col_node)
+                        down[up[col_node]] = node
+                        up[col_node] = node
+                        column.append(col_node)
+                        size[col_node] += 1
+        cls.__template = (left, right, up, down, column, size, placements)
+
+    def __search(self, limit: int):
+        if SudokuSolver.__template is None:
+            SudokuSolver.__build_template()
+        left, right, up, down, column, size, placements = SudokuSolver.__template
+        L, R, U, D, C, S = list(left), list(right), list(up), list(down), column, list(size)
+        self.solution = None
+        self.count = 0
+
+        def cover(col: int):
+            R[L[col]] = R[col]
+            L[R[col]] = L[col]
+            i = D[col]
+            while i != col:
+                j = R[i]
+                while j != i:
+                    U[D[j]] = U[j]
+                    D[U[j]] = D[j]
+                    S[C[j]] -= 1
+                    j = R[j]
+                i = D[i]
+
+        def uncover(col: int):
+            i = U[col]
+            while i != col:
+                j = L[i]
+                while j != i:
+                    S[C[j]] += 1
+                    U[D[j]] = j
+                    D[U[j]] = j
+                    j = L[j]
+                i = U[i]
+            R[L[col]] = col
+            L[R[col]] = col
+
+        # Place the givens, two givens claiming the same constraint means no solution
+        chosen: List[int] = []
+        covered = bytearray(325)
+        for cell, digit in enumerate(self.givens):
+            if digit == 0:
+                continue
+            node = placements[cell * 9 + digit - 1]
+            for j in range(node, node + 4):
+                if covered[C[j]]:
+                    return
+                covered[C[j]] = 1
+                cover(C[j])
+            chosen.append(node)
+
+        def search() -> bool:
+            if R[0] == 0:
+                self.count += 1
+                if self.solution is None:
+                    self.solution = self.__to_string(chosen, placements)
+                return self.count >= limit
+
+            # Pick the column with the fewest placements left
+            col = R[0]
+            best = S[col]
+            j = R[col]
+            while j != 0 and best > 1:
+                if S[j] < best:
+                    col = j
+                    best = S[j]
+                j = R[j]
+            if best == 0:
+                return False
+
+            cover(col)
+            r = D[col]
+            while r != col:
+                chosen.append(r)
+                j = R[r]
+                while j != r:
+                    cover(C[j])
+                    j = R[j]
+                if search():
+                    return True
+                j = L[r]
+                while j != r:
+                    uncover(C[j])
+                    j = L[j]
+                chosen.pop()
+                r = D[r]
+            uncover(col)
+            return False
+
+        search()
+
+    def __to_string(self, chosen: List[int], placements: List[int]) -> str:
+        # Placement nodes are laid out in (row, col, digit) order, four per placement
+        grid = ["0"] * 81
+        first = placements[0]
+        for node in chosen:
+            index = (node - first) // 4
+            grid[index // 9] = str(index % 9 + 1)
+        return "".join(grid)
+
+
+def solve_puzzle_string(puzzle_string: str) -> str:
+    """
+    Solution of one collection line, or unsolved/multiple/invalid
+    """
+    puzzle_string = puzzle_string.strip()
+    if len(puzzle_string) != 81:
+        return "invalid"
+    try:
+        solver = SudokuSolver(puzzle_string)
+        count = solver.count_solutions(2)
+    except (ValueError, IndexError):
+        return "invalid"
+    if count == 0:
+        return "unsolved"
+    if count > 1:
+        return "multiple"
+    return solver.solution
+
+def solve_chunk(puzzles: List[str]) -> List[str]:
+    return [solve_puzzle_string(puzzle) for puzzle in puzzles]
+
+def read_chunks(lines: Iterable[str], chunk_size: int) -> Iterator[List[str]]:
+    chunk: List[str] = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def worker_pool(processes: int) -> Optional["multiprocessing.pool.Pool"]:
+    """
+    The pool a command hands to map_chunks, None when it runs in one process
+    """
+    if processes == 1:
+        return None
+    return multiprocessing.Pool(processes)
+
+def map_chunks(func: Callable, chunks: Iterable[List[str]], processes: int,
+               pool: Optional["multiprocessing.pool.Pool"] = None) -> Iterator:
+    """
+    Runs func over the chunks in a pool of worker processes, results come back
+    in order. Only a few chunks per process are handed out ahead of the results
+    read back, so a big collection streams through in bounded memory. Without
+    a pool one is started just for these chunks.
+    """
+    if processes == 1:
+        yield from map(func, chunks)
+        return
+    if pool is None:
+        with multiprocessing.Pool(processes) as pool:
+            yield from map_chunks(func, chunks, processes, pool)
+        return
+    pending: deque = deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(func, (chunk,)))
+        if len(pending) >= processes * CHUNKS_IN_FLIGHT:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def batch_solve(file_name: str, out: TextIO, processes: int = 0, chunk_size: int = 256) -> Tuple[int, float]:
+    """
+    Solves every puzzle of a collection, writing one result line per puzzle.
+    Returns the number of puzzles and the seconds it took.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    start = time.perf_counter()
+    count = 0
+    for results in map_chunks(solve_chunk, read_chunks(iter_collection(file_name), chunk_size), processes):
+        for result in results:
+            out.write(result + "\n")
+        count += len(results)
+    return count, time.perf_counter() - start
+
+def check_numpy():
+    if np is None:
+        raise ImportError("the batch candidate functions need numpy, install it with pip install numpy")
+
+def load_givens(file_name: str) -> "np.ndarray":
+    """
+    The puzzles of a .sdm, .seed or .sdb collection as an (N, 81) uint8 array,
+    0 for empty cells. Row i is the i-th puzzle as PuzzleCollection numbers
+    them, a line that is not a puzzle raises a ValueError. The pool is not
+    kept around like the game's seed pools.
+    """
+    check_numpy()
+    return np.frombuffer(SudokuBoard.read_seed_pool(file_name, strict=True), dtype=np.uint8).reshape(-1, 81)
+
+def batch_candidates(givens: "np.ndarray", boolean: bool = False) -> "np.ndarray":
+    """
+    Candidates of every cell of an (N, 81) array of values, as (N, 81) uint16
+    masks with bit (digit - 1) set like SudokuGame.candidates, or with boolean
+    as an (N, 81, 9) array. Solved cells have no candidates.
+    """
+    check_numpy()
+    givens = np.asarray(givens, dtype=np.uint8).reshape(-1, 81)
+    units = np.array([[row * 9 + col for row, col in unit] for unit in UNITS])
+    cell_units = np.array(CELL_UNITS)
+    digit_bits = np.array(DIGIT_BITS, dtype=np.uint16)
+
+    bits = digit_bits[givens]
+    placed = np.bitwise_or.reduce(bits[:, units], axis=2)
+    seen = np.bitwise_or.reduce(placed[:, cell_units], axis=2)
+    masks = np.where(givens == 0, ALL_DIGITS & ~seen, 0).astype(np.uint16)
+    if boolean:
+        return masks_to_boolean(masks)
+    return masks
+
+def masks_to_boolean(masks: "np.ndarray") -> "np.ndarray":
+    check_numpy()
+    return (masks[..., np.newaxis] >> np.arange(9, dtype=np.uint16) & 1).astype(bool)
+
+def batch_propagate_singles(givens: "np.ndarray", hidden: bool = True) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Fills in naked singles, and hidden singles unless hidden is False, for
+    all the puzzles at once until none of them has any left. Returns the
+    (N, 81) values and the (N, 81) candidate masks after that.
+    """
+    check_numpy()
+    values = np.array(givens, dtype=np.uint8).reshape(-1, 81)
+    masks = np.zeros(values.shape, dtype=np.uint16)
+    units = np.array([[row * 9 + col for row, col in unit] for unit in UNITS])
+    lowest_digit = np.frombuffer(LOWEST_DIGIT, dtype=np.uint8)
+    popcount = np.frombuffer(POPCOUNT, dtype=np.uint8)
+    # Puzzles that got something filled in last round, the rest are done
+    active = np.arange(len(values))
+    while active.size:
+        current = values[active]
+        current_masks = batch_candidates(current)
+        masks[active] = current_masks
+        found = np.zeros(current.shape, dtype=np.uint8)
+
+        naked = popcount[current_masks] == 1
+        found[naked] = lowest_digit[current_masks[naked]]
+
+        if hidden:
+            # (N, 27 units, 9 cells, 9 digits), a digit with one place left in a unit goes there
+            places = masks_to_boolean(current_masks)[:, units]
+            single = places.sum(axis=2) == 1
+            puzzle, unit, digit = np.nonzero(single)
+            position = places[puzzle, unit, :, digit].argmax(axis=1)
+            found[puzzle, units[unit, position]] = digit + 1
+
+        found[current != 0] = 0
+        changed = found.any(axis=1)
+        values[active[changed]] = np.where(found != 0, found, current)[changed]
+        active = active[changed]
+    return values, masks
+
 Hint = namedtuple('Hint', "technique cells1 cells2 good_cands bad_cands text")
 
+class EngineStats(object):
+    """
+    Counters per technique of the HintEngines that were handed this object:
+    calls, hits (hints found), seconds spent and combinations examined.
+    Stats from other engines or worker processes can be merged in.
+    """
+    FIELDS = ("calls", "hits", "seconds", "combinations")
+
+    def __init__(self):
+        self.techniques: Dict[str, List[float]] = {}
+
+    def record(self, name: str, hit: bool, seconds: float, combinations: int):
+        counters = self.techniques.setdefault(name, [0, 0, 0.0, 0])
+        counters[0] += 1
+        counters[1] += hit
+        counters[2] += seconds
+        counters[3] += combinations
+
+    def merge(self, other: "EngineStats"):
+        for name, other_counters in other.techniques.items():
+            counters = self.techniques.setdefault(name, [0, 0, 0.0, 0])
+            for field, value in enumerate(other_counters):
+                counters[field] += value
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        return {name: dict(zip(self.FIELDS, counters)) for name, counters in self.techniques.items()}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def __str__(self) -> str:
+        lines = ["{:<20}{:>8}{:>8}{:>10}{:>14}".format("technique", "calls", "hits", "ms", "combinations")]
+        for name, (calls, hits, seconds, combinations) in self.techniques.items():
+            lines.append("{:<20}{:>8}{:>8}{:>10.1f}{:>14}".format(name, calls, hits, seconds * 1000, combinations))
+        return "\n".join(lines)
+
+class LinkGraph(object):
+    """
+    Strong and weak links between the candidates of a board. A candidate is
+    the node index * 9 + digit - 1. Two candidates are weakly linked when
+    they can't both be true: the same digit in cells that see each other, or
+    two digits of one cell. They are strongly linked when one of them has to
+    be true: the only two places for a digit in a unit, or the two digits of
+    a bivalue cell. The graph belongs to a game and is brought up to date
+    with sync(), which only redoes the links of the cells that changed.
+    """
+
+    def __init__(self):
+        # Candidates the links were built from, solved cells have none
+        self.masks = [0] * 81
+        # Bit per cell for every digit
+        self.boards = [0] * 10
+        # The two candidates linked by the only places of a digit in a unit, per unit * 9 + digit - 1
+        self.conjugates: List[Optional[Tuple[int, int]]] = [None] * 243
+        # Strong neighbours in a unit, with the number of units linking them
+        self.strong: List[Dict[int, int]] = [{} for node in range(729)]
+        # Weak neighbours as they are asked for, until the next change
+        self.peers: Dict[int, List[int]] = {}
+        self.weak: Dict[int, List[int]] = {}
+
+    def sync(self, game: "SudokuGame") -> int:
+        """
+        Updates the links after candidates were added or removed or cells set
+        since the last sync, returns the number of cells that changed
+        """
+        puzzle = game.puzzle
+        dirty = set()
+        changed = 0
+        for index in range(81):
+            row, col = CELLS[index]
+            mask = 0 if puzzle[row][col] != 0 else game.candidates[index]
+            old = self.masks[index]
+            if mask == old:
+                continue
+            changed += 1
+            self.masks[index] = mask
+            for digit in MASK_DIGITS[old ^ mask]:
+                self.boards[digit] ^= 1 << index
+                dirty.update(unit * 9 + digit - 1 for unit in CELL_UNITS[index])
+        for key in dirty:
+            self.__update_conjugates(key)
+        if changed:
+            self.peers = {}
+            self.weak = {}
+        return changed
+
+    def __update_conjugates(self, key: int):
+        unit, digit = divmod(key, 9)
+        board = self.boards[digit + 1]
+        places = [row * 9 + col for row, col in UNITS[unit] if board >> (row * 9 + col) & 1]
+        pair = (places[0] * 9 + digit, places[1] * 9 + digit) if len(places) == 2 else None
+        old = self.conjugates[key]
+        if pair == old:
+            return
+        if old is not None:
+            for node, other in (old, old[::-1]):
+                count = self.strong[node][other] - 1
+                if count:
+                    self.strong[node][other] = count
+                else:
+                    del self.strong[node][other]
+        if pair is not None:
+            for node, other in (pair, pair[::-1]):
+                self.strong[node][other] = self.strong[node].get(other, 0) + 1
+        self.conjugates[key] = pair
+
+    def copy(self) -> "LinkGraph":
+        """
+        A graph of its own with the same links, to sync with a snapshot of
+        the game while the game keeps this one
+        """
+        copy = LinkGraph()
+        copy.masks = self.masks[:]
+        copy.boards = self.boards[:]
+        copy.conjugates = self.conjugates[:]
+        copy.strong = [dict(links) for links in self.strong]
+        return copy
+
+    def nodes(self, digit: int = 0) -> List[int]:
+        """
+        The candidates of the board, or only those of the digit
+        """
+        masks = self.masks
+        digits = range(1, 10) if digit == 0 else (digit,)
+        return [index * 9 + digit - 1 for index in range(81) for digit in digits if masks[index] & DIGIT_BITS[digit]]
+
+    def peer_links(self, node: int) -> List[int]:
+        links = self.peers.get(node)
+        if links is None:
+            index, digit = divmod(node, 9)
+            board = self.boards[digit + 1]
+            links = [peer * 9 + digit for peer in PEER_INDEXES[index] if board >> peer & 1]
+            self.peers[node] = links
+        return links
+
+    def cell_links(self, node: int) -> List[int]:
+        index = node // 9
+        return [index * 9 + digit - 1 for digit in MASK_DIGITS[self.masks[index]] if index * 9 + digit - 1 != node]
+
+    def weak_links(self, node: int) -> List[int]:
+        links = self.weak.get(node)
+        if links is None:
+            links = self.peer_links(node) + self.cell_links(node)
+            self.weak[node] = links
+        return links
+
+    def bivalue_link(self, node: int) -> List[int]:
+        if POPCOUNT[self.masks[node // 9]] != 2:
+            return []
+        return self.cell_links(node)
+
+    def strong_links(self, node: int) -> List[int]:
+        return list(self.strong[node]) + self.bivalue_link(node)
+
+    def find_chain(self, targets: List[int], nodes: Set[int], strong: Callable[[int], List[int]],
+                   weak: Callable[[int], List[int]], length: int) -> Optional[List[int]]:
+        """
+        Looks for a target that can't be true: if it were, it would turn off a
+        chain node it sees, and following strong links (off to on) and weak
+        links (on to off) over the nodes would turn on a candidate that sees
+        the target. All targets are followed at once in one breadth first
+        search, every node keeps a bit per target that reached it, so the
+        shortest chain of any of them is found first. Returns that chain, as
+        the candidates from the first one turned off to the last one turned
+        on, or None when there is no chain of up to length strong links.
+        """
+        off_seen: Dict[int, int] = {}
+        on_seen: Dict[int, int] = {}
+        for target in targets:
+            for node in self.weak_links(target):
+                if node in nodes:
+                    off_seen[node] = off_seen.get(node, 0) | 1 << target
+        off_front = off_seen
+        weak_bits: Dict[int, int] = {}
+        for step in range(length):
+            on_front: Dict[int, int] = {}
+            for node, bits in off_front.items():
+                for other in strong(node):
+                    if other in nodes:
+                        on_front[other] = on_front.get(other, 0) | bits
+            on_front = {node: bits & ~on_seen.get(node, 0) for node, bits in on_front.items() if bits & ~on_seen.get(node, 0)}
+            for node, bits in on_front.items():
+                on_seen[node] = on_seen.get(node, 0) | bits
+                if node not in weak_bits:
+                    weak_bits[node] = sum(1 << other for other in self.weak_links(node))
+                if bits & weak_bits[node]:
+                    found = bits & weak_bits[node]
+                    target = (found & -found).bit_length() - 1
+                    return self.__trace_chain(target, nodes, strong, weak, step + 1)
+            if step == length - 1:
+                break
+            off_front = {}
+            for node, bits in on_front.items():
+                for other in weak(node):
+                    if other in nodes:
+                        off_front[other] = off_front.get(other, 0) | bits
+            off_front = {node: bits & ~off_seen.get(node, 0) for node, bits in off_front.items() if bits & ~off_seen.get(node, 0)}
+            for node, bits in off_front.items():
+                off_seen[node] = off_seen.get(node, 0) | bits
+        return None
+
+    def __trace_chain(self, target: int, nodes: Set[int], strong: Callable[[int], List[int]],
+                      weak: Callable[[int], List[int]], length: int) -> List[int]:
+        # The same search for the one target, remembering where every node was reached from
+        sees_target = set(self.weak_links(target))
+        parents: Dict[Tuple[int, bool], Optional[Tuple[int, bool]]] = {}
+        front = []
+        for node in self.weak_links(target):
+            if node in nodes:
+                parents[(node, False)] = None
+                front.append((node, False))
+        for step in range(length):
+            on_front = []
+            for state in front:
+                for other in strong(state[0]):
+                    if other in nodes and not (other, True) in parents:
+                        parents[(other, True)] = state
+                        on_front.append((other, True))
+            for state in on_front:
+                if state[0] in sees_target:
+                    chain = []
+                    while state is not None:
+                        chain.append(state[0])
+                        state = parents[state]
+                    return chain[::-1]
+            front = []
+            for state in on_front:
+                for other in weak(state[0]):
+                    if other in nodes and not (other, False) in parents:
+                        parents[(other, False)] = state
+                        front.append((other, False))
+        return []
+
 class HintEngine(object):
     """
     Here will be methods that searches hints for solving a sudoku
 
     Most functions will return Hints
     """
-    def __init__(self, game):
+    def __init__(self, game, cancelled: Optional[threading.Event] = None, stats: Optional[EngineStats] = None):
         self.hint = None
+        self.technique_name = ""
         self.game = game
+        self.cancelled = cancelled
+        self.stats = stats
+        # Candidate combinations the techniques looked at, for the stats
+        self.combinations = 0
+        self.candidates = game.candidates
+        # Unsolved cells of every unit, the board doesn't change while searching
+        self.unsolved: List[Optional[List[Tuple[int, int]]]] = [None] * 27
+        self.unsolved_masks: Optional[List[int]] = None
+        # Where every digit can go, per unit and for the whole board, filled in as needed
+        self.positions: List[Optional[Dict[int, List[Tuple[int, int]]]]] = [None] * 27
+        self.unit_masks: List[Optional[List[int]]] = [None] * 27
+        self.hidden_subsets: List[Optional[List[List[Tuple[Tuple[int, ...], int]]]]] = [None] * 27
+        self.digit_cells: Optional[List[List[Tuple[int, int]]]] = None
+        self.digit_boards: List[int] = []
+        self.digit_lines: List[List[int]] = []
+        self.links: Optional[LinkGraph] = None
         self.techs = [
             self.__naked_single,
             self.__hidden_single,
@@ -141,12 +899,72 @@ class HintEngine(object):
             self.__hidden_triple,
             self.__xwings,
             self.__skyscrapers,
+            self.__swordfish,
+            self.__finned_xwings,
+            self.__simple_colouring,
+            self.__finned_swordfish,
+            self.__x_chains,
+            self.__xy_chains,
+            self.__jellyfish,
+            self.__finned_jellyfish,
+            self.__aic,
         ]
 
+    def __get_positions(self, unit: int) -> Dict[int, List[Tuple[int, int]]]:
+        """
+        Cells of the unit where each digit can go, built the first time a
+        technique asks for the unit and shared by all of them after that
+        """
+        positions = self.positions[unit]
+        if positions is None:
+            cells: List[List[Tuple[int, int]]] = [[] for digit in range(10)]
+            masks = [0] * 10
+            puzzle = self.game.puzzle
+            for position, (row, col) in enumerate(UNITS[unit]):
+                if puzzle[row][col] != 0:
+                    continue
+                for digit in MASK_DIGITS[self.candidates[row * 9 + col]]:
+                    cells[digit].append((row, col))
+                    masks[digit] |= 1 << position
+            positions = {digit: cells[digit] for digit in range(1, 10) if cells[digit]}
+            self.positions[unit] = positions
+            self.unit_masks[unit] = masks
+        return positions
+
+    def __index_digits(self):
+        """
+        One pass over the board for the cells of every digit, also kept as an
+        81 bit board and as line masks: the columns the digit can go in for
+        each row, followed by the rows for each column
+        """
+        self.digit_cells = [[] for digit in range(10)]
+        self.digit_boards = [0] * 10
+        self.digit_lines = [[0] * 18 for digit in range(10)]
+        puzzle = self.game.puzzle
+        for index in range(81):
+            row, col = CELLS[index]
+            if puzzle[row][col] != 0:
+                continue
+            for digit in MASK_DIGITS[self.candidates[index]]:
+                self.digit_cells[digit].append(CELLS[index])
+                self.digit_boards[digit] |= 1 << index
+                lines = self.digit_lines[digit]
+                lines[row] |= 1 << col
+                lines[9 + col] |= 1 << row
+
     def get_hint(self) -> Hint:
         for tech in self.techs:
-            tech()
+            if self.cancelled is not None and self.cancelled.is_set():
+                return None
+            if self.stats is None:
+                tech()
+            else:
+                combinations = self.combinations
+                start = time.perf_counter()
+                tech()
+                self.stats.record(tech.__name__.lstrip("_"), self.hint is not None, time.perf_counter() - start, self.combinations - combinations)
             if not self.hint is None:
+                self.technique_name = tech.__name__.lstrip("_")
                 break
 
         return self.hint
@@ -161,18 +979,21 @@ class HintEngine(object):
             self.__skyscraper_cols(cand)
 
     def __skyscraper_rows(self, cand: int):
-        coords = self.__get_coords(cand)
+        if self.digit_cells is None:
+            self.__index_digits()
+        coords = self.digit_cells[cand]
         if len(coords) < 5:
             return
 
         strong_links = []
         for row in range(9):
-            cur_row = [ (r, c) for r, c in coords if r == row ]
+            cur_row = self.__get_positions(9 + row).get(cand, ())
             if len(cur_row) == 2:
                 strong_links.append(cur_row)
 
         strong_combos = it.combinations(strong_links, 2)
         for combo in strong_combos:
+            self.combinations += 1
             cols = set()
             for lst in combo:
                 for row, col in lst:
@@ -215,7 +1036,7 @@ class HintEngine(object):
                     good_cands.append((row, col, cand))
                 bad_cands: List[Tuple[int, int, int]] = []
                 for row, col in common_coords:
-                    if cand in self.game.get_candidates(row, col):
+                    if self.digit_boards[cand] >> (row * 9 + col) & 1:
                         bad_cands.append((row, col, cand))
                 if not bad_cands:
                     continue
@@ -223,18 +1044,21 @@ class HintEngine(object):
 
 
     def __skyscraper_cols(self, cand: int):
-        coords = self.__get_coords(cand)
+        if self.digit_cells is None:
+            self.__index_digits()
+        coords = self.digit_cells[cand]
         if len(coords) < 5:
             return
 
         strong_links = []
         for col in range(9):
-            cur_col = [ (r, c) for r, c in coords if c == col ]
+            cur_col = self.__get_positions(18 + col).get(cand, ())
             if len(cur_col) == 2:
                 strong_links.append(cur_col)
 
         strong_combos = it.combinations(strong_links, 2)
         for combo in strong_combos:
+            self.combinations += 1
             rows = set()
             for lst in combo:
                 for row, col in lst:
@@ -277,579 +1101,429 @@ class HintEngine(object):
                     good_cands.append((row, col, cand))
                 bad_cands: List[Tuple[int, int, int]] = []
                 for row, col in common_coords:
-                    if cand in self.game.get_candidates(row, col):
+                    if self.digit_boards[cand] >> (row * 9 + col) & 1:
                         bad_cands.append((row, col, cand))
                 if not bad_cands:
                     continue
                 self.hint = Hint("Skyscraper columns: {}".format(cand), cells1, cells2, good_cands, bad_cands, "Skyscraper colums")
 
     def __xwings(self):
-        for cand in range(1,10):
-            self.__xw_rows(cand)
-            if not self.hint is None:
-                return
+        self.__search_fish(2, False)
 
-        for cand in range(1,10):
-            self.__xw_cols(cand)
-
-    def __xw_rows(self, cand: int):
-        coords = self.__get_coords(cand)
-        if len(coords) < 5:
-            return
-
-        strong_links = []
-        for row in range(9):
-            cur_row = [ (r, c) for r, c in coords if r == row ]
-            if len(cur_row) == 2:
-                strong_links.append(cur_row)
-
-        strong_combos = it.combinations(strong_links, 2)
-        for combo in strong_combos:
-            cols = set()
-            for lst in combo:
-                for row, col in lst:
-                    cols.add(col)
+    def __swordfish(self):
+        self.__search_fish(3, False)
 
-            if len(cols) == 2:
-                rows = set()
-                for lst in combo:
-                    for row, col in lst:
-                        rows.add(row)
+    def __jellyfish(self):
+        self.__search_fish(4, False)
 
-                cells1 = []
-                for row in list(rows):
-                    cells1.extend(self.__get_row_coords(row))
-                cells2 = []
-                for col in list(cols):
-                    cells2.extend([coord for coord in self.__get_col_coords(col) if coord not in cells1])
+    def __finned_xwings(self):
+        self.__search_fish(2, True)
 
-                good_cands = []
-                for lst in combo:
-                    for row, col in lst:
-                        good_cands.append((row, col, cand))
+    def __finned_swordfish(self):
+        self.__search_fish(3, True)
 
-                bad_cands = []
-                for row, col in cells2:
-                    if cand in self.game.get_candidates(row, col):
-                        bad_cands.append((row, col, cand))
+    def __finned_jellyfish(self):
+        self.__search_fish(4, True)
 
-                if not bad_cands:
+    def __search_fish(self, size: int, finned: bool):
+        if self.digit_cells is None:
+            self.__index_digits()
+        # Rows as base lines first, then columns
+        for base in (0, 9):
+            for cand in range(1, 10):
+                self.__search_fish_lines(cand, base, size, finned)
+                if not self.hint is None:
                     return
 
-                self.hint = Hint("X-wing in rows: {}".format(cand), cells1, cells2, good_cands, bad_cands, "X-wing rows")
-
-
-
-    def __xw_cols(self, cand: int):
-        coords = self.__get_coords(cand)
-        if len(coords) < 5:
+    def __search_fish_lines(self, cand: int, base: int, size: int, finned: bool):
+        """
+        Fish on the line masks of the digit, the base lines are rows when base
+        is 0 and columns when it's 9, the cover lines go the other way. Lines
+        with one place left are hidden singles and don't take part. The fins
+        of a finned fish all sit in one box, so a branch stops as soon as the
+        positions outside every box along the lines add up to more than size.
+        """
+        lines = self.digit_lines[cand]
+        cover = 9 - base
+        spread = OUTSIDE_FINS if finned else POPCOUNT
+        indexes = [line for line in range(9) if POPCOUNT[lines[base + line]] >= 2 and spread[lines[base + line]] <= size]
+        if len(indexes) < size:
             return
+        found: List[Tuple[Tuple[int, ...], int]] = []
+        self.__extend_fish(lines[base:base + 9], indexes, size, spread, 0, (), 0, found)
+        for chosen, union in found:
+            base_mask = sum(1 << line for line in chosen)
+            if not finned:
+                if POPCOUNT[union] == size:
+                    eliminate = [(line, cross) for cross in MASK_POSITIONS[union]
+                                 for line in MASK_POSITIONS[lines[cover + cross] & ~base_mask]]
+                    self.__create_fish_hint(cand, base, chosen, union, 0, eliminate)
+            elif POPCOUNT[union] > size:
+                self.__search_fins(cand, base, chosen, union, base_mask)
+            if not self.hint is None:
+                return
 
-        strong_links = []
-        for col in range(9):
-            cur_col = [ (r, c) for r, c in coords if c == col ]
-            if len(cur_col) == 2:
-                strong_links.append(cur_col)
-
-        strong_combos = it.combinations(strong_links, 2)
-        for combo in strong_combos:
-            rows = set()
-            for lst in combo:
-                for row, col in lst:
-                    rows.add(row)
-
-            if len(rows) == 2:
-                cols = set()
-                for lst in combo:
-                    for row, col in lst:
-                        cols.add(col)
-
-                cells1 = []
-                for col in list(cols):
-                    cells1.extend(self.__get_col_coords(col))
-                cells2 = []
-                for row in list(rows):
-                    cells2.extend([coord for coord in self.__get_row_coords(row) if coord not in cells1])
-
-                good_cands = []
-                for lst in combo:
-                    for row, col in lst:
-                        good_cands.append((row, col, cand))
-
-                bad_cands = []
-                for row, col in cells2:
-                    if cand in self.game.get_candidates(row, col):
-                        bad_cands.append((row, col, cand))
+    def __extend_fish(self, masks: List[int], indexes: List[int], size: int, spread: bytes, start: int,
+                      chosen: Tuple[int, ...], union: int, found: List[Tuple[Tuple[int, ...], int]]):
+        stop = len(indexes) - size + len(chosen) + 1
+        self.combinations += max(stop - start, 0)
+        for i in range(start, stop):
+            line = indexes[i]
+            new_union = union | masks[line]
+            if spread[new_union] > size:
+                continue
+            lines = chosen + (line,)
+            if len(lines) < size:
+                self.__extend_fish(masks, indexes, size, spread, i + 1, lines, new_union, found)
+            else:
+                found.append((lines, new_union))
 
-                if not bad_cands:
+    def __search_fins(self, cand: int, base: int, chosen: Tuple[int, ...], union: int, base_mask: int):
+        """
+        Tries every way of covering the base lines with as many cover lines,
+        leaving the rest of their positions as fins in one box. Either a fin
+        is the digit, or the fish is, so the cover cells in the box of the fins
+        lose the digit. When the fins leave a base line with only one cell in
+        the cover it's a sashimi fish.
+        """
+        lines = self.digit_lines[cand]
+        cover = 9 - base
+        size = len(chosen)
+        for stack in range(3):
+            stack_mask = 0x7 << stack * 3
+            outside = union & ~stack_mask
+            need = size - POPCOUNT[outside]
+            inside = MASK_POSITIONS[union & stack_mask]
+            # The fins need a cover line in their box to eliminate anything
+            if need < 1 or need >= len(inside):
+                continue
+            for covered in it.combinations(inside, need):
+                self.combinations += 1
+                cover_mask = outside | sum(1 << cross for cross in covered)
+                if any(not lines[base + line] & cover_mask for line in chosen):
+                    continue
+                fin_mask = union & ~cover_mask
+                bands = set(line // 3 for line in chosen if lines[base + line] & fin_mask)
+                if len(bands) != 1:
+                    continue
+                band_mask = 0x7 << bands.pop() * 3
+                eliminate = [(line, cross) for cross in covered
+                             for line in MASK_POSITIONS[lines[cover + cross] & band_mask & ~base_mask]]
+                self.__create_fish_hint(cand, base, chosen, cover_mask, fin_mask, eliminate)
+                if not self.hint is None:
                     return
 
-                self.hint = Hint("X-wing in columns: {}".format(cand), cells1, cells2, good_cands, bad_cands, "X-wing columns")
-
-    def __get_coords(self, cand: int) -> List[Tuple[int,int]]:
-        coords: List[Tuple[int, int]] = []
-        for row in range(9):
-            for col in range(9):
-                if self.game.get_cell(row, col) == 0:
-                    cands = list(self.game.get_candidates(row, col))
-                    if cand in cands:
-                        coords.append((row, col))
-
-        return coords
+    def __create_fish_hint(self, cand: int, base: int, chosen: Tuple[int, ...], cover_mask: int, fin_mask: int,
+                           eliminate: List[Tuple[int, int]]):
+        if not eliminate:
+            return
+        lines = self.digit_lines[cand]
+        names = {2: "X-wing", 3: "Swordfish", 4: "Jellyfish"}
+        name = names[len(chosen)]
+        if fin_mask:
+            sashimi = any(POPCOUNT[lines[base + line] & cover_mask] == 1 for line in chosen)
+            name = "{} {}".format("Sashimi" if sashimi else "Finned", name)
+        direction = "rows" if base == 0 else "columns"
+        # Position cross of line is a cell of the row or column unit
+        base_units = [UNITS[9 + base + line] for line in chosen]
+        cells1 = [cell for unit in base_units for cell in unit]
+        cells2 = [cell for cross in MASK_POSITIONS[cover_mask] for cell in UNITS[18 - base + cross] if not cell in cells1]
+        good_cands = [unit[cross] + (cand,) for line, unit in zip(chosen, base_units) for cross in MASK_POSITIONS[lines[base + line]]]
+        bad_cands = [UNITS[9 + base + line][cross] + (cand,) for line, cross in eliminate]
+        technique = "{} in {}: {}".format(name, direction, cand)
+        self.hint = Hint(technique, cells1, cells2, good_cands, bad_cands, "{} {}".format(name, direction))
+
+    def __get_links(self) -> LinkGraph:
+        """
+        The link graph of the game, kept with the game so only the cells that
+        changed since the last hint have their links redone
+        """
+        if self.links is None:
+            if self.game.links is None:
+                self.game.links = LinkGraph()
+            self.links = self.game.links
+            self.links.sync(self.game)
+        return self.links
+
+    def __simple_colouring(self):
+        links = self.__get_links()
+        for digit in range(1, 10):
+            nodes = links.nodes(digit)
+            coloured: Dict[int, int] = {}
+            for start in nodes:
+                if start in coloured or not links.strong[start]:
+                    continue
+                # Colour the candidates joined by strong links of the digit in two alternating colours
+                colours: Tuple[List[int], List[int]] = ([], [])
+                coloured[start] = 0
+                queue = deque([start])
+                while queue:
+                    node = queue.popleft()
+                    colours[coloured[node]].append(node)
+                    for other in links.strong[node]:
+                        if not other in coloured:
+                            coloured[other] = 1 - coloured[node]
+                            queue.append(other)
+                self.combinations += 1
+                self.__check_colours(digit, nodes, colours)
+                if not self.hint is None:
+                    return
 
-    def __hidden_pair(self):
-        # boxes first
-        for box_no in range(1,10):
-            coords = self.__get_box_coords(box_no)
-            self.__search_hidden_pair(coords)
-            if not self.hint is None:
+    def __check_colours(self, digit: int, nodes: List[int], colours: Tuple[List[int], List[int]]):
+        links = self.links
+        # Two candidates of one colour that see each other can't both be true, so none of that colour is
+        for colour in colours:
+            members = set(colour)
+            if any(other in members for node in colour for other in links.peer_links(node)):
+                self.__create_colouring_hint(digit, colours, colour, "Colour wrap")
                 return
-        # then rows
-        for row in range(9):
-            coords = self.__get_row_coords(row)
-            self.__search_hidden_pair(coords)
-            if not self.hint is None:
+        # Any other candidate that sees both colours is off, one of them is true
+        first, second = set(colours[0]), set(colours[1])
+        eliminate = []
+        for node in nodes:
+            if node in first or node in second:
+                continue
+            peers = links.peer_links(node)
+            if any(other in first for other in peers) and any(other in second for other in peers):
+                eliminate.append(node)
+        if eliminate:
+            self.__create_colouring_hint(digit, colours, eliminate, "Colour trap")
+
+    def __create_colouring_hint(self, digit: int, colours: Tuple[List[int], List[int]], eliminate: List[int], text: str):
+        cells1 = [CELLS[node // 9] for node in colours[0]]
+        cells2 = [CELLS[node // 9] for node in colours[1]]
+        good_cands = [CELLS[node // 9] + (digit,) for colour in colours for node in colour if not node in eliminate]
+        bad_cands = [CELLS[node // 9] + (digit,) for node in eliminate]
+        self.hint = Hint("Simple colouring: {}".format(digit), cells1, cells2, good_cands, bad_cands, text)
+
+    def __x_chains(self):
+        links = self.__get_links()
+        for digit in range(1, 10):
+            nodes = links.nodes(digit)
+            self.combinations += len(nodes)
+            chain = links.find_chain(nodes, set(nodes), lambda node: list(links.strong[node]), links.peer_links, CHAIN_LENGTH)
+            if chain:
+                self.__create_chain_hint(chain, "X-chain")
                 return
 
-        for col in range(9):
-            coords = self.__get_col_coords(col)
-            self.__search_hidden_pair(coords)
+    def __xy_chains(self):
+        links = self.__get_links()
+        targets = links.nodes()
+        nodes = set(node for node in targets if POPCOUNT[links.masks[node // 9]] == 2)
+        self.combinations += len(targets)
+        chain = links.find_chain(targets, nodes, links.bivalue_link, links.peer_links, CHAIN_LENGTH)
+        if chain:
+            self.__create_chain_hint(chain, "XY-chain")
+
+    def __aic(self):
+        links = self.__get_links()
+        targets = links.nodes()
+        self.combinations += len(targets)
+        chain = links.find_chain(targets, set(targets), links.strong_links, links.weak_links, CHAIN_LENGTH)
+        if chain:
+            self.__create_chain_hint(chain, "AIC")
+
+    def __create_chain_hint(self, chain: List[int], text: str):
+        """
+        The first candidate of the chain is on or the last one is on, so
+        anything that sees both of them goes
+        """
+        links = self.links
+        eliminate = set(links.weak_links(chain[0])).intersection(links.weak_links(chain[-1]))
+        names = ["{}r{}c{}".format(node % 9 + 1, node // 9 // 9 + 1, node // 9 % 9 + 1) for node in chain]
+        # Strong and weak links take turns, starting with a strong one
+        technique = "{}: {}".format(text, "".join(name + (" = " if i % 2 == 0 else " - ") for i, name in enumerate(names[:-1])) + names[-1])
+        cells1 = list(dict.fromkeys(CELLS[node // 9] for node in chain))
+        good_cands = [CELLS[node // 9] + (node % 9 + 1,) for node in chain]
+        bad_cands = [CELLS[node // 9] + (node % 9 + 1,) for node in sorted(eliminate)]
+        self.hint = Hint(technique, cells1, None, good_cands, bad_cands, text)
 
-    def __search_hidden_pair(self, coords: List[Tuple[int, int]]):
-        coord_places = self.__get_candidate_positions(coords)
-        places = {cand: frozenset(cur_coords) for cand, cur_coords in coord_places.items() if len(cur_coords) == 2 }
-        if len(places) < 2:
-            return
-        place_cands: Dict[frozenset, List[int]] = {}
-        for cand, coord_set in places.items():
-            if coord_set in place_cands:
-                place_cands[coord_set].append(cand)
-            else:
-                place_cands[coord_set] = [cand]
-
-        for cur_coords_set, cands in place_cands.items():
-            if len(cands) == 2:
-                cur_coords = list(cur_coords_set)
-                bad_cands = []
-                for row,col in cur_coords:
-                    for cand in self.game.get_candidates(row, col):
-                        if cand not in cands:
-                            bad_cands.append((row, col, cand))
-                if not bad_cands:
-                    continue
-                cells1 = coords
-                good_cands = []
-                for row,col in cur_coords:
-                    for cand in cands:
-                        good_cands.append((row, col, cand))
-                self.hint = Hint("Hidden pair {} {}".format(cands[0], cands[1]), cells1, None, good_cands, bad_cands, "Hidden pair")
+    def __hidden_pair(self):
+        # boxes first, then rows and columns
+        for unit in range(27):
+            self.__search_hidden_subset(unit, 2)
+            if not self.hint is None:
                 return
 
     def __hidden_triple(self):
-        # boxes first
-        for box_no in range(1,10):
-            coords = self.__get_box_coords(box_no)
-            self.__search_hidden_triple(coords)
-            if not self.hint is None:
-                return
-        # then rows
-        for row in range(9):
-            coords = self.__get_row_coords(row)
-            self.__search_hidden_triple(coords)
+        for unit in range(27):
+            self.__search_hidden_subset(unit, 3)
             if not self.hint is None:
                 return
 
-        for col in range(9):
-            coords = self.__get_col_coords(col)
-            self.__search_hidden_triple(coords)
-
-    def __search_hidden_triple(self, coords: List[Tuple[int, int]]):
-        coord_places = self.__get_candidate_positions(coords)
-        places = {cand: frozenset(cur_coords) for cand, cur_coords in coord_places.items() }
-        if len(places) < 3:
-            return
-        all_cands = set()
-        for cand_set in places.keys():
-            all_cands.add(cand_set)
-
-        place_cands: Dict[int, set] = {}
-        for cand, coord_set in places.items():
-            if cand in place_cands:
-                place_cands[cand].add(coord_set)
-            else:
-                place_cands[cand] = set(coord_set)
-
-        combinations = [set(combo) for combo in it.combinations(all_cands, 3)]
-        for combo in combinations:
-            cell_set = set()
-            for cand in combo:
-                cand_cells = [cell for cell in list(place_cands[cand])]
-                for cell in cand_cells:
-                    cell_set.add(cell)
-            if len(cell_set) == 3:
-                containing_cells = list(cell_set)
-                cells1 = coords
-                good_cands = []
-                bad_cands = []
-                for row, col in containing_cells:
-                    for cand in self.game.get_candidates(row, col):
-                        if cand in combo:
-                            good_cands.append((row, col, cand))
-                        else:
-                            bad_cands.append((row, col, cand))
-                if not bad_cands:
-                    continue
-
-                x,y,z = tuple(combo)
-                self.hint = Hint("Hidden triple {} {} {}".format(x,y,z), cells1, None, good_cands, bad_cands, "Hidden Triple" )
-                return
-
     def __hidden_quad(self):
-        # boxes first
-        for box_no in range(1,10):
-            coords = self.__get_box_coords(box_no)
-            self.__search_hidden_quad(coords)
-            if not self.hint is None:
-                return
-        # then rows
-        for row in range(9):
-            coords = self.__get_row_coords(row)
-            self.__search_hidden_quad(coords)
+        for unit in range(27):
+            self.__search_hidden_subset(unit, 4)
             if not self.hint is None:
                 return
 
-        for col in range(9):
-            coords = self.__get_col_coords(col)
-            self.__search_hidden_quad(coords)
-
-    def __search_hidden_quad(self, coords: List[Tuple[int, int]]):
-        coord_places = self.__get_candidate_positions(coords)
-        places = {cand: frozenset(cur_coords) for cand, cur_coords in coord_places.items() }
-        if len(places) < 4:
-            return
-        all_cands = set()
-        for cand_set in places.keys():
-            all_cands.add(cand_set)
-
-        place_cands: Dict[int, set] = {}
-        for cand, coord_set in places.items():
-            if cand in place_cands:
-                place_cands[cand].add(coord_set)
-            else:
-                place_cands[cand] = set(coord_set)
-
-        combinations = [set(combo) for combo in it.combinations(all_cands, 4)]
-        for combo in combinations:
-            cell_set = set()
-            for cand in combo:
-                cand_cells = [cell for cell in list(place_cands[cand])]
-                for cell in cand_cells:
-                    cell_set.add(cell)
-            if len(cell_set) == 4:
-                containing_cells = list(cell_set)
-                cells1 = coords
-                good_cands = []
-                bad_cands = []
-                for row, col in containing_cells:
-                    for cand in self.game.get_candidates(row, col):
-                        if cand in combo:
-                            good_cands.append((row, col, cand))
-                        else:
-                            bad_cands.append((row, col, cand))
-                if not bad_cands:
-                    continue
-
-                w,x,y,z = tuple(combo)
-                self.hint = Hint("Hidden quad {} {} {} {}".format(w,x,y,z), cells1, None, good_cands, bad_cands, "Hidden Quad" )
-                return
-
-    def __get_candidate_positions(self, coords: List[Tuple[int, int]]) -> Dict[int, List[Tuple[int, int]]]:
-        coord_cand = {(row, col): self.game.get_candidates(row, col) for row, col in coords}
-
-        cand_coord: Dict[int, List[Tuple[int, int]]] = {}
-        for coord, cands in coord_cand.items():
-            for cand in cands:
-                if cand in cand_coord:
-                    cand_coord[cand].append(coord)
-                else:
-                    cand_coord[cand] = [coord]
-
-        return cand_coord
-
-
-
-    def __naked_triple(self):
-        # boxes first
-        for box_no in range(1,10):
-            coords = self.__get_box_coords(box_no)
-            triplets = [(frozenset(self.game.get_candidates(row, col)), (row, col)) for row, col in coords if len(self.game.get_candidates(row, col)) <= 3]
-            if not triplets:
-                continue
-            triplet_coords = self.__get_triplet_coords(triplets)
-            if not triplet_coords:
-                continue
-            for triplet, cur_coords in triplet_coords.items():
-                x, y, z = tuple(triplet)
-                # Affecting row
-                rows = set([row for row, col in cur_coords])
-                if len(rows) == 1:
-                    cells1 = coords + self.__get_row_coords(list(rows)[0])
-                    self.__create_triple_hint(x,y,z, cells1, cur_coords)
-                    if not self.hint is None:
-                        return
-
-                # Affecting column
-                cols = set([col for row, col in cur_coords])
-                if len(cols) == 1:
-                    cells1 = coords + self.__get_col_coords(list(cols)[0])
-                    self.__create_triple_hint(x,y,z, cells1, cur_coords)
-                    if not self.hint is None:
-                        return
-
-                # Only box
-                cells1 = coords
-                self.__create_triple_hint(x,y,z, cells1, cur_coords)
-                if not self.hint is None:
-                    return
-
-        # Then rows
-        for row in range(9):
-            coords = self.__get_row_coords(row)
-            triplets = [(frozenset(self.game.get_candidates(row, col)), (row, col)) for row, col in coords if len(self.game.get_candidates(row, col)) <= 3]
-            if not triplets:
-                continue
-            triplet_coords = self.__get_triplet_coords(triplets)
-            if not triplet_coords:
-                continue
-            for triplet, cur_coords in triplet_coords.items():
-                x, y, z = tuple(triplet)
-                cells1 = coords
-                self.__create_triple_hint(x,y,z, cells1, cur_coords)
-                if not self.hint is None:
-                    return
-
-
-        # Then colums
-        for col in range(9):
-            coords = self.__get_col_coords(col)
-            triplets = [(frozenset(self.game.get_candidates(row, col)), (row, col)) for row, col in coords if len(self.game.get_candidates(row, col)) <= 3]
-            if not triplets:
-                continue
-            triplet_coords = self.__get_triplet_coords(triplets)
-            if not triplet_coords:
+    def __get_hidden_subsets(self, unit: int) -> List[List[Tuple[Tuple[int, ...], int]]]:
+        """
+        Every hidden pair, triple and quad of the unit, found in one pass and
+        kept for the other sizes. Indexed by size, each one is the digits and
+        the mask of the positions they share. Digits with one place left are
+        hidden singles and don't take part. Digits are added in ascending
+        order and a branch stops as soon as the digits cover more than four
+        cells, as no subset can come out of it anymore.
+        """
+        subsets = self.hidden_subsets[unit]
+        if subsets is None:
+            subsets = [[] for size in range(5)]
+            self.__get_positions(unit)
+            unit_masks = self.unit_masks[unit]
+            digits = [digit for digit in range(1, 10) if 2 <= POPCOUNT[unit_masks[digit]] <= 4]
+            masks = [unit_masks[digit] for digit in digits]
+            count = len(digits)
+            for i in range(count):
+                self.combinations += count - i - 1
+                for j in range(i + 1, count):
+                    union2 = masks[i] | masks[j]
+                    if POPCOUNT[union2] > 4:
+                        continue
+                    if POPCOUNT[union2] == 2:
+                        subsets[2].append(((digits[i], digits[j]), union2))
+                    self.combinations += count - j - 1
+                    for k in range(j + 1, count):
+                        union3 = union2 | masks[k]
+                        if POPCOUNT[union3] > 4:
+                            continue
+                        if POPCOUNT[union3] == 3:
+                            subsets[3].append(((digits[i], digits[j], digits[k]), union3))
+                        self.combinations += count - k - 1
+                        for l in range(k + 1, count):
+                            union4 = union3 | masks[l]
+                            if POPCOUNT[union4] == 4:
+                                subsets[4].append(((digits[i], digits[j], digits[k], digits[l]), union4))
+            self.hidden_subsets[unit] = subsets
+        return subsets
+
+    def __search_hidden_subset(self, unit: int, size: int):
+        names = {2: ("pair", "Hidden pair"), 3: ("triple", "Hidden Triple"), 4: ("quad", "Hidden Quad")}
+        coords = self.__get_unsolved(unit)
+        for digits, positions in self.__get_hidden_subsets(unit)[size]:
+            containing_cells = [UNITS[unit][position] for position in range(9) if positions >> position & 1]
+            good_cands = []
+            bad_cands = []
+            for row, col in containing_cells:
+                for cand in MASK_DIGITS[self.candidates[row * 9 + col]]:
+                    if cand in digits:
+                        good_cands.append((row, col, cand))
+                    else:
+                        bad_cands.append((row, col, cand))
+            if not bad_cands:
                 continue
-            for triplet, cur_coords in triplet_coords.items():
-                x, y, z = tuple(triplet)
-                cells1 = coords
-                self.__create_triple_hint(x,y,z, cells1, cur_coords)
-                if not self.hint is None:
-                    return
-
-    def __create_triple_hint(self, x: int, y: int, z: int, cells1: List[Tuple[int, int]], cur_coords: List[Tuple[int, int]]):
-        good_cands = [(row, col, x) for row, col in cur_coords] + [(row, col, y) for row, col in cur_coords] + [(row, col, z) for row, col in cur_coords]
-        bad_x = [(row, col, x) for row, col in cells1 if (row, col) not in cur_coords and x in self.game.get_candidates(row, col)]
-        bad_y = [(row, col, y) for row, col in cells1 if (row, col) not in cur_coords and y in self.game.get_candidates(row, col)] 
-        bad_z = [(row, col, z) for row, col in cells1 if (row, col) not in cur_coords and z in self.game.get_candidates(row, col)] 
-        bad_cands = bad_x + bad_y + bad_z
-        if not bad_cands:
+            name, text = names[size]
+            technique = "Hidden {} {}".format(name, " ".join(map(str, digits)))
+            self.hint = Hint(technique, coords, None, good_cands, bad_cands, text)
             return
-        self.hint = Hint("Naked triple {} {} {}".format(x, y, z), cells1, None, good_cands, bad_cands, "Naked triple")
 
-    def __get_triplet_coords(self, triplets: List[Tuple[frozenset, Tuple[int, int]]]) -> Dict[frozenset, List[Tuple[int, int]]]:
-        triplet_coords = {}
-        combinations = it.combinations(triplets, 3)
-        for a, b, c in combinations:
-            union = a[0].union(b[0], c[0])
-            if len(union) == 3:
-                triplet_coords[union] = [a[1], b[1], c[1]]
+    def __naked_pair(self):
+        self.__search_naked_subset(2)
 
-        return triplet_coords
+    def __naked_triple(self):
+        self.__search_naked_subset(3)
 
     def __naked_quad(self):
-        # boxes first
-        for box_no in range(1,10):
-            coords = self.__get_box_coords(box_no)
-            quads = [(frozenset(self.game.get_candidates(row, col)), (row, col)) for row, col in coords if len(self.game.get_candidates(row, col)) <= 4]
-            if not quads:
-                continue
-            quad_coords = self.__get_quad_coords(quads)
-            if not quad_coords:
-                continue
-            for quad, cur_coords in quad_coords.items():
-                x, y, z, a = tuple(quad)
-                # Affecting row
-                rows = set([row for row, col in cur_coords])
-                if len(rows) == 1:
-                    cells1 = coords + self.__get_row_coords(list(rows)[0])
-                    self.__create_quad_hint(x,y,z,a, cells1, cur_coords)
-                    if not self.hint is None:
-                        return
-
-                # Affecting column
-                cols = set([col for row, col in cur_coords])
-                if len(cols) == 1:
-                    cells1 = coords + self.__get_col_coords(list(cols)[0])
-                    self.__create_quad_hint(x,y,z,a, cells1, cur_coords)
-                    if not self.hint is None:
-                        return
+        self.__search_naked_subset(4)
 
-                # Only box
-                cells1 = coords
-                self.__create_quad_hint(x,y,z,a, cells1, cur_coords)
-                if not self.hint is None:
-                    return
-
-        # Then rows
-        for row in range(9):
-            coords = self.__get_row_coords(row)
-            quads = [(frozenset(self.game.get_candidates(row, col)), (row, col)) for row, col in coords if len(self.game.get_candidates(row, col)) <= 4]
-            if not quads:
-                continue
-            quad_coords = self.__get_quad_coords(quads)
-            if not quad_coords:
-                continue
-            for quad, cur_coords in quad_coords.items():
-                x, y, z, a = tuple(quad)
-                cells1 = coords
-                self.__create_quad_hint(x,y,z,a, cells1, cur_coords)
-                if not self.hint is None:
-                    return
-
-
-        # Then colums
-        for col in range(9):
-            coords = self.__get_col_coords(col)
-            quads = [(frozenset(self.game.get_candidates(row, col)), (row, col)) for row, col in coords if len(self.game.get_candidates(row, col)) <= 4]
-            if not quads:
-                continue
-            quad_coords = self.__get_quad_coords(quads)
-            if not quad_coords:
-                continue
-            for quad, cur_coords in quad_coords.items():
-                x, y, z, a = tuple(quad)
-                cells1 = coords
-                self.__create_quad_hint(x,y,z,a, cells1, cur_coords)
-                if not self.hint is None:
-                    return
+    def __get_unsolved_masks(self) -> List[int]:
+        # Candidate masks with 0 for the solved cells, shared by the naked subset sizes
+        if self.unsolved_masks is None:
+            puzzle = self.game.puzzle
+            self.unsolved_masks = [0 if value != 0 else mask for value, mask in zip(it.chain.from_iterable(puzzle), self.candidates)]
+        return self.unsolved_masks
 
-    def __create_quad_hint(self, x: int, y: int, z: int, a: int, cells1: List[Tuple[int, int]], cur_coords: List[Tuple[int, int]]):
-        good_cands = [(row, col, x) for row, col in cur_coords] + [(row, col, y) for row, col in cur_coords] + [(row, col, z) for row, col in cur_coords] + [(row, col, a) for row, col in cur_coords]
-        bad_x = [(row, col, x) for row, col in cells1 if (row, col) not in cur_coords and x in self.game.get_candidates(row, col)]
-        bad_y = [(row, col, y) for row, col in cells1 if (row, col) not in cur_coords and y in self.game.get_candidates(row, col)] 
-        bad_z = [(row, col, z) for row, col in cells1 if (row, col) not in cur_coords and z in self.game.get_candidates(row, col)] 
-        bad_a = [(row, col, a) for row, col in cells1 if (row, col) not in cur_coords and a in self.game.get_candidates(row, col)] 
-        bad_cands = bad_x + bad_y + bad_z + bad_a
-        if not bad_cands:
-            return
-        self.hint = Hint("Naked quad {} {} {} {}".format(x, y, z, a), cells1, None, good_cands, bad_cands, "Naked quad")
-
-    def __get_quad_coords(self, quads: List[Tuple[frozenset, Tuple[int, int]]]) -> Dict[frozenset, List[Tuple[int, int]]]:
-        quad_coords = {}
-        combinations = it.combinations(quads, 4)
-        for a, b, c, d in combinations:
-            union = a[0].union(b[0], c[0], d[0])
-            if len(union) == 4:
-                quad_coords[union] = [a[1], b[1], c[1], d[1]]
-
-        return quad_coords
-
-    def __naked_pair(self):
-        # boxes first
-        for box_no in range(1,10):
-            coords = self.__get_box_coords(box_no)
-            pairs = [(frozenset(self.game.get_candidates(row, col)), (row, col)) for row, col in coords if len(self.game.get_candidates(row, col)) == 2]
-            if not pairs:
-                continue
-            pair_coords = self.__get_pair_coords(pairs)
-            for pair, cur_coords in pair_coords.items():
-                x, y = tuple(pair)
-                if len(cur_coords) == 2:
-                    # Affecting row
-                    rows = set([row for row,col in cur_coords])
-                    if len(rows) == 1:
-                        cells1 = coords + self.__get_row_coords(list(rows)[0])
-                        self.__create_pair_hint(x,y,cells1, cur_coords)
-                        if not self.hint is None:
-                            return
-
-                    # Affecting column
-                    cols = set([col for row,col in cur_coords])
-                    if len(cols) == 1:
-                        cells1 = coords + self.__get_col_coords(list(cols)[0])
-                        self.__create_pair_hint(x,y,cells1, cur_coords)
-                        if not self.hint is None:
-                            return
-
-                    # Only box
-                    cells1 = coords
-                    self.__create_pair_hint(x,y, cells1, cur_coords)
-                    if not self.hint is None:
-                        return
-
-        # Then rows
-        for row in range(9):
-            coords = self.__get_row_coords(row)
-            pairs = [(frozenset(self.game.get_candidates(row, col)), (row, col)) for row, col in coords if len(self.game.get_candidates(row, col)) == 2]
-            if not pairs:
-                continue
-            pair_coords = self.__get_pair_coords(pairs)
-            for pair, cur_coords in pair_coords.items():
-                x, y = tuple(pair)
-                if len(cur_coords) == 2:
-                    cells1 = coords
-                    self.__create_pair_hint(x,y, cells1, cur_coords)
-                    if not self.hint is None:
-                        return
-
-        # At last columns
-        for col in range(9):
-            coords = self.__get_col_coords(col)
-            pairs = [(frozenset(self.game.get_candidates(row, col)), (row, col)) for row, col in coords if len(self.game.get_candidates(row, col)) == 2]
-            if not pairs:
+    def __get_naked_subsets(self, cells: List[int], size: int) -> List[Tuple[Tuple[int, ...], int]]:
+        """
+        Naked subsets of the given size among the cells of a unit, as cell
+        indexes and the mask of their candidates. Pairs are cells with the
+        same two candidates, for triples and quads the cells are combined in
+        order and a branch stops as soon as their candidates add up to more
+        than size digits.
+        """
+        masks = self.unsolved_masks
+        count = len(cells)
+        found: List[Tuple[Tuple[int, ...], int]] = []
+        if size == 2:
+            self.combinations += count
+            first: Dict[int, int] = {}
+            for index in cells:
+                other = first.setdefault(masks[index], index)
+                if other != index:
+                    found.append(((other, index), masks[index]))
+            found.sort()
+            return found
+        cell_masks = [masks[index] for index in cells]
+        for i in range(count - size + 1):
+            self.combinations += count - size + 1 - i
+            for j in range(i + 1, count - size + 2):
+                union2 = cell_masks[i] | cell_masks[j]
+                if POPCOUNT[union2] > size:
+                    continue
+                self.combinations += count - size + 2 - j
+                for k in range(j + 1, count - size + 3):
+                    union3 = union2 | cell_masks[k]
+                    if POPCOUNT[union3] > size:
+                        continue
+                    if size == 3:
+                        if POPCOUNT[union3] == 3:
+                            found.append(((cells[i], cells[j], cells[k]), union3))
+                        continue
+                    self.combinations += count - k - 1
+                    for l in range(k + 1, count):
+                        union4 = union3 | cell_masks[l]
+                        if POPCOUNT[union4] == 4:
+                            found.append(((cells[i], cells[j], cells[k], cells[l]), union4))
+        return found
+
+    def __search_naked_subset(self, size: int):
+        names = {2: "Naked pair", 3: "Naked triple", 4: "Naked quad"}
+        # Only cells with 2 to size candidates can take part, listed per unit in one pass
+        masks = self.__get_unsolved_masks()
+        unit_cells: List[List[int]] = [[] for unit in range(27)]
+        for index in range(81):
+            if 2 <= POPCOUNT[masks[index]] <= size:
+                box, row, col = CELL_UNITS[index]
+                unit_cells[box].append(index)
+                unit_cells[row].append(index)
+                unit_cells[col].append(index)
+        for unit in range(27):
+            if len(unit_cells[unit]) < size:
                 continue
-            pair_coords = self.__get_pair_coords(pairs)
-            for pair, cur_coords in pair_coords.items():
-                x, y = tuple(pair)
-                if len(cur_coords) == 2:
-                    cells1 = coords
-                    self.__create_pair_hint(x, y, cells1, cur_coords)
-                    if not self.hint is None:
-                        return
-
-    def __create_pair_hint(self, x: int, y: int, cells1: List[Tuple[int, int]], cur_coords: List[Tuple[int, int]]):
-        good_cands = [(row, col, x) for row, col in cur_coords] + [(row, col, y) for row, col in cur_coords]
-        bad_x = [(row, col, x) for row, col in cells1 if (row, col) not in cur_coords and x in self.game.get_candidates(row, col)]
-        bad_y = [(row, col, y) for row, col in cells1 if (row, col) not in cur_coords and y in self.game.get_candidates(row, col)] 
-        bad_cands = bad_x + bad_y
-        if not bad_cands:
-            return
-        self.hint = Hint("Naked pair {} {}".format(x, y), cells1, None, good_cands, bad_cands, "Naked pair")
-
-    def __get_pair_coords(self, pairs: List[Tuple[frozenset, Tuple[int, int]]]) -> Dict[frozenset, List[Tuple[int, int]]]:
-        pair_coords: Dict[frozenset, List[Tuple[int, int]]] = {}
-        for pair, coord in pairs:
-            if pair in pair_coords:
-                pair_coords[pair].append(coord)
-            else:
-                pair_coords[pair] = [coord]
-
-        return pair_coords
+            for subset, union in self.__get_naked_subsets(unit_cells[unit], size):
+                # Every unit the cells share, a subset inside a box and a line
+                # eliminates from both and is only reported from the box
+                units = [shared for shared in CELL_UNITS[subset[0]] if all(shared in CELL_UNITS[index] for index in subset)]
+                if unit >= 9 and units[0] < 9:
+                    continue
+                if not any(masks[index] & union for shared in units for index in UNIT_INDEXES[shared] if not index in subset):
+                    continue
+                cells = [CELLS[index] for index in subset]
+                digits = MASK_DIGITS[union]
+                cells1 = [coord for shared in units for coord in self.__get_unsolved(shared)]
+                others = [coord for coord in dict.fromkeys(cells1) if coord not in cells]
+                good_cands = [(row, col, digit) for digit in digits for row, col in cells]
+                bad_cands = [(row, col, digit) for digit in digits for row, col in others if self.candidates[row * 9 + col] & DIGIT_BITS[digit]]
+                if not bad_cands:
+                    continue
+                technique = "{} {}".format(names[size], " ".join(map(str, digits)))
+                self.hint = Hint(technique, cells1, None, good_cands, bad_cands, names[size])
+                return
 
     def __box_line_reduction(self):
         # First check rows
         for row in range(9):
-            coords = self.__get_row_coords(row)
-            self.__search_bl_reduction(coords)
+            self.__search_bl_reduction(9 + row)
 
         if not self.hint is None:
             return
         # Then columns
         for col in range(9):
-            coords = self.__get_col_coords(col)
-            self.__search_bl_reduction(coords)
+            self.__search_bl_reduction(18 + col)
 
-    def __search_bl_reduction(self, coords: List[Tuple[int, int]]):
-        candidate_coords = self.__get_candidate_coords(coords)
+    def __search_bl_reduction(self, unit: int):
+        coords = self.__get_unsolved(unit)
+        candidate_coords = self.__get_positions(unit)
 
         for candidate in range(1,10):
             cur_coords = candidate_coords.get(candidate, None)
@@ -857,41 +1531,25 @@ class HintEngine(object):
             if cur_coords is None:
                 continue
 
-            boxes = set()
-            for row, col in cur_coords:
-                boxes.add(self.__get_box(row, col))
-
-            # Are all of the candidates in the same box?
-            if len(boxes) == 1:
+            # Are all of the candidates in the same box? Only the box of the first can hold them all
+            row, col = cur_coords[0]
+            box = CELL_BOX[row][col]
+            if INTERSECTIONS[(box, unit)].issuperset(cur_coords):
                 # Do we have any candidates to delete in that box
-                box_coords = [cell for cell in self.__get_box_coords(list(boxes)[0]) if cell not in cur_coords]
-                bad_cands = [(row, col, candidate) for (row, col) in box_coords if candidate in self.game.get_candidates(row, col)]
+                box_coords = [cell for cell in self.__get_box_coords(box + 1) if cell not in cur_coords]
+                bad_cands = [(row, col, candidate) for (row, col) in box_coords if self.candidates[row * 9 + col] & DIGIT_BITS[candidate]]
                 if not bad_cands:
                     continue
                 good_cands = [(row, col, candidate) for (row, col) in cur_coords]
                 cells1 = coords + box_coords
 
                 self.hint = Hint("Box-line reduction", cells1, None, good_cands, bad_cands, "Box line interaction")
-                return
-
-
-
-    def __get_box(self, row: int, col: int) -> int:
-        box_row = row // 3
-        box_col = col // 3
-
-        boxes = [
-            [1, 2, 3],
-            [4, 5, 6],
-            [7, 8, 9]
-        ]
-
-        return boxes[box_row][box_col]
+                return
 
     def __pointing(self):
         for box_no in range(1,10):
             coords = self.__get_box_coords(box_no)
-            candidate_coords = self.__get_candidate_coords(coords)
+            candidate_coords = self.__get_positions(box_no - 1)
 
             # Go through each candidate to see if it is pointing
             for candidate in range(1,10):
@@ -903,13 +1561,13 @@ class HintEngine(object):
                 # Filter out already answered cells
                 # Can only be pointing if 2 or three candidates
                 if len(cur_coords) == 2 or len(cur_coords) == 3:
+                    first_row, first_col = cur_coords[0]
                     # are we row pointing
-                    rows = set([row for row, col in cur_coords])
-                    if len(rows) == 1:
+                    if INTERSECTIONS[(box_no - 1, 9 + first_row)].issuperset(cur_coords):
                         # we are pointing in a row, are we pointing at something that we can delete?
-                        row_coords = self.__get_row_coords(list(rows)[0])
+                        row_coords = self.__get_row_coords(first_row)
                         row_coords = [(row, col) for row, col in row_coords if (row, col) not in cur_coords]
-                        bad_cands = [(row, col, candidate) for (row, col) in row_coords if candidate in self.game.get_candidates(row, col)]
+                        bad_cands = [(row, col, candidate) for (row, col) in row_coords if self.candidates[row * 9 + col] & DIGIT_BITS[candidate]]
                         if not bad_cands:
                             continue
                         good_cands = [(row, col, candidate) for (row, col) in cur_coords]
@@ -917,12 +1575,11 @@ class HintEngine(object):
                         self.hint = Hint("Pointing Pair/Triple (row)", cells1, None, good_cands, bad_cands, "Pointing Pair/Triple reduces row")
                         return
 
-                    cols = set([col for row, col in cur_coords])
-                    if len(cols) == 1:
+                    if INTERSECTIONS[(box_no - 1, 18 + first_col)].issuperset(cur_coords):
                         # we are pointing in a column, are we pointing at something we can delete?
-                        col_coords = self.__get_col_coords(list(cols)[0])
+                        col_coords = self.__get_col_coords(first_col)
                         col_coords = [(row, col) for row, col in col_coords if (row, col) not in cur_coords]
-                        bad_cands = [(row, col, candidate) for (row, col) in col_coords if candidate in self.game.get_candidates(row, col)]
+                        bad_cands = [(row, col, candidate) for (row, col) in col_coords if self.candidates[row * 9 + col] & DIGIT_BITS[candidate]]
                         if not bad_cands:
                             continue
                         good_cands = [(row, col, candidate) for (row, col) in cur_coords]
@@ -930,27 +1587,16 @@ class HintEngine(object):
                         self.hint = Hint("Pointing Pair/Triple (column)", cells1, None, good_cands, bad_cands, "Pointing Pair/Triple reduces row")
                         return
 
-    def __get_candidate_coords(self, coords: List[Tuple[int, int]]) -> Dict[int, List[Tuple[int, int]]]:
-        candidate_coords: Dict[int, List[Tuple[int, int]]] = {}
-        # Build list of locations where each candidate can be
-        for row, col in coords:
-            candidates = self.game.get_candidates(row, col)
-            for candidate in candidates:
-                if candidate in candidate_coords:
-                    candidate_coords[candidate].append((row, col))
-                else:
-                    candidate_coords[candidate] = [(row, col)]
-        return candidate_coords
-
     def __naked_single(self):
         good_cells = []
         good_cands = []
-        for row in range(9):
-            for col in range(9):
-                cands = self.game.get_candidates(row, col)
-                if len(cands) == 1 and self.game.get_cell(row, col) == 0:
-                    good_cells.append((row,col))
-                    good_cands.append((row,col,cands[0]))
+        puzzle = self.game.puzzle
+        for index in range(81):
+            mask = self.candidates[index]
+            row, col = CELLS[index]
+            if POPCOUNT[mask] == 1 and puzzle[row][col] == 0:
+                good_cells.append((row, col))
+                good_cands.append((row, col, LOWEST_DIGIT[mask]))
 
         if len(good_cells) > 0:
             self.hint = Hint("Naked single", good_cells, None, good_cands, None, "The only number that can go in this cell is")
@@ -971,7 +1617,7 @@ class HintEngine(object):
     def __hs_search_box(self):
         for box_no in range(1,10):
             coords = self.__get_box_coords(box_no)
-            found, (coord, cand) = self.__hs_search(coords)
+            found, (coord, cand) = self.__hs_search(box_no - 1)
             if found:
                 row, col = coord
                 self.hint = Hint("Hidden single (box)", coords, None, ((row, col, cand),), None, "In the box this is the only cell with this candidate")
@@ -980,7 +1626,7 @@ class HintEngine(object):
     def __hs_search_row(self):
         for row in range(9):
             coords = self.__get_row_coords(row)
-            found, (coord, cand) = self.__hs_search(coords)
+            found, (coord, cand) = self.__hs_search(9 + row)
             if found:
                 row, col = coord
                 self.hint = Hint("Hidden single (row)", coords, None, ((row, col, cand),), None, "In the row this candidate can only be here" )
@@ -989,114 +1635,574 @@ class HintEngine(object):
     def __hs_search_col(self):
         for col in range(9):
             coords = self.__get_col_coords(col)
-            found, (coord, cand) = self.__hs_search(coords)
+            found, (coord, cand) = self.__hs_search(18 + col)
             if found:
                 row, col = coord
                 self.hint = Hint("Hidden single (column)", coords, None, ((row, col, cand),), None, "In the column this candidate can only be here" )
                 return
 
-    def __hs_search(self, coords: List[Tuple[int, int]]) -> Tuple[bool, Tuple[Tuple[int, int], int]]:
-        cnt: Counter = Counter()
-        search_coords = [ (row, col) for row, col in coords if self.game.get_cell(row,col) == 0]
-        for row, col in search_coords:
-            cnt.update(self.game.get_candidates(row, col))
-
-        for i in range(1,10):
-            if cnt[i] == 1:
-                for row, col in search_coords:
-                    if i in self.game.get_candidates(row, col):
-                        return (True, ((row,col), i))
+    def __hs_search(self, unit: int) -> Tuple[bool, Tuple[Tuple[int, int], int]]:
+        for cand, cells in self.__get_positions(unit).items():
+            if len(cells) == 1:
+                return (True, (cells[0], cand))
         return (False, ((0,0), 0))
 
     def __get_buddy_coords(self, row: int, col: int) -> List[Tuple[int,int]]:
-        coords = set()
-        box_no = self.__get_box(row, col)
-        for coord in self.__get_box_coords(box_no):
-            coords.add(coord)
-        for coord in self.__get_row_coords(row):
-            coords.add(coord)
-        for coord in self.__get_col_coords(col):
-            coords.add(coord)
-
-        return list(coords)
+        puzzle = self.game.puzzle
+        return [(r, c) for r, c in PEERS[row * 9 + col] if puzzle[r][c] == 0]
+
+    def __get_unsolved(self, unit: int) -> List[Tuple[int, int]]:
+        coords = self.unsolved[unit]
+        if coords is None:
+            puzzle = self.game.puzzle
+            coords = [(row, col) for row, col in UNITS[unit] if puzzle[row][col] == 0]
+            self.unsolved[unit] = coords
+        return coords
 
     def __get_box_coords(self, box_no: int) -> List[Tuple[int, int]]:
-        coords: list = [
-            ((0,0),(0,0),(0,0),(0,0),(0,0),(0,0),(0,0),(0,0),(0,0)),
-            # Box 1
-            ((0,0),(0,1),(0,2),(1,0),(1,1),(1,2),(2,0),(2,1),(2,2)),
-            # Box 2
-            ((0,3),(0,4),(0,5),(1,3),(1,4),(1,5),(2,3),(2,4),(2,5)),
-            # Box 3
-            ((0,6),(0,7),(0,8),(1,6),(1,7),(1,8),(2,6),(2,7),(2,8)),
-            # Box 4
-            ((3,0),(3,1),(3,2),(4,0),(4,1),(4,2),(5,0),(5,1),(5,2)),
-            # Box 5
-            ((3,3),(3,4),(3,5),(4,3),(4,4),(4,5),(5,3),(5,4),(5,5)),
-            # Box 6
-            ((3,6),(3,7),(3,8),(4,6),(4,7),(4,8),(5,6),(5,7),(5,8)),
-            # Box 7
-            ((6,0),(6,1),(6,2),(7,0),(7,1),(7,2),(8,0),(8,1),(8,2)),
-            # Box 8
-            ((6,3),(6,4),(6,5),(7,3),(7,4),(7,5),(8,3),(8,4),(8,5)),
-            # Box 9
-            ((6,6),(6,7),(6,8),(7,6),(7,7),(7,8),(8,6),(8,7),(8,8)),
-        ]
-        return [(row, col) for row, col in coords[box_no] if self.game.get_cell(row, col) == 0]
+        return self.__get_unsolved(box_no - 1)
 
     def __get_row_coords(self, row: int) -> List[Tuple[int, int]]:
-        coords = []
-        for i in range(9):
-            coords.append((row,i))
-        return [(row, col) for row, col in coords if self.game.get_cell(row, col) == 0]
+        return self.__get_unsolved(9 + row)
 
     def __get_col_coords(self, col: int) -> List[Tuple[int, int]]:
-        coords = []
-        for i in range(9):
-            coords.append((i, col))
-        return [(row, col) for row, col in coords if self.game.get_cell(row, col) == 0]
+        return self.__get_unsolved(18 + col)
 
     def get_naked(self) -> Hint:
         self.__naked_single()
         return self.hint
 
+class HintSearch(object):
+    """
+    Looks for a hint on a snapshot of the game in a worker thread, so the UI
+    keeps running meanwhile. A cancelled search stops after the technique it
+    is busy with and finds nothing.
+    """
+    def __init__(self, game):
+        self.snapshot = game.snapshot()
+        self.stats = EngineStats()
+        self.hint: Optional[Hint] = None
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def __run(self):
+        self.hint = HintEngine(self.snapshot, self.cancelled, self.stats).get_hint()
+        self.done.set()
+
+    def cancel(self):
+        self.cancelled.set()
+
+class PuzzleGeneration(object):
+    """
+    Makes a new puzzle of the difficulty in a worker thread, for when there
+    are no seeds of it. generate_puzzle is tried until it gets one, which
+    can take a while for the harder ones. A cancelled generation stops after
+    the try it is busy with.
+    """
+    def __init__(self, difficulty: str):
+        self.difficulty = difficulty
+        self.puzzle: Optional[str] = None
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def __run(self):
+        while not self.cancelled.is_set():
+            result = generate_puzzle(self.difficulty)
+            if result is not None:
+                self.puzzle = result[0]
+                break
+        self.done.set()
+
+    def cancel(self):
+        self.cancelled.set()
+
+class HintCache(object):
+    """
+    The hints found for the last positions, keyed by their zobrist hash.
+    None is kept too, for positions where no hint was found. When full the
+    least recently used position makes way.
+    """
+    def __init__(self, limit: int = HINT_CACHE_SIZE):
+        self.limit = limit
+        self.hints: "OrderedDict[int, Optional[Hint]]" = OrderedDict()
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.hints
+
+    def __len__(self) -> int:
+        return len(self.hints)
+
+    def get(self, key: int) -> Optional[Hint]:
+        self.hints.move_to_end(key)
+        return self.hints[key]
+
+    def put(self, key: int, hint: Optional[Hint]):
+        self.hints[key] = hint
+        self.hints.move_to_end(key)
+        if len(self.hints) > self.limit:
+            self.hints.popitem(last=False)
+
+class PuzzleCollection(object):
+    """
+    A collection file (.sdm or .seed, one puzzle per line) with random access
+    by puzzle number. The offsets of the lines are found once and the puzzles
+    are read straight from a memory map of the file. With persist the offsets
+    are also saved next to the collection, so they are only found once.
+    Empty and whitespace only lines are not puzzles and get no number.
+    """
+    # 02: blank lines are left out of the index
+    INDEX_MAGIC = b"SDKIDX02"
+
+    def __init__(self, file_name: str, persist: bool = False):
+        self.file_name = file_name
+        self.index_name = file_name + ".idx"
+        self.file = open(file_name, "rb")
+        stat = os.fstat(self.file.fileno())
+        self.data: Union[mmap.mmap, bytes] = b""
+        if stat.st_size > 0:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets: Optional[array] = None
+        if persist:
+            self.offsets = self.__load_index(stat)
+        if self.offsets is None:
+            self.offsets = self.__build_index()
+            if persist:
+                self.__save_index(stat)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, number: int) -> str:
+        return self.get(number)
+
+    def get(self, number: int) -> str:
+        start = self.offsets[number]
+        end = self.data.find(b"\n", start)
+        if end == -1:
+            end = len(self.data)
+        return self.data[start:end].decode("ascii").strip()
+
+    def random(self) -> str:
+        return self.get(random.randrange(len(self.offsets)))
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __build_index(self) -> array:
+        offsets = array('Q')
+        size = len(self.data)
+        start = 0
+        while start < size:
+            end = self.data.find(b"\n", start)
+            if end == -1:
+                end = size
+            if self.data[start:end].strip():
+                offsets.append(start)
+            start = end + 1
+        return offsets
+
+    def __load_index(self, stat: os.stat_result) -> Optional[array]:
+        # The index is only good for the exact file it was made from
+        try:
+            with open(self.index_name, "rb") as file:
+                header = file.read(24)
+                if header != self.INDEX_MAGIC + stat.st_size.to_bytes(8, "little") + stat.st_mtime_ns.to_bytes(8, "little"):
+                    return None
+                offsets = array('Q')
+                offsets.frombytes(file.read())
+                return offsets
+        except (OSError, ValueError):
+            return None
+
+    def __save_index(self, stat: os.stat_result):
+        try:
+            with open(self.index_name, "wb") as file:
+                file.write(self.INDEX_MAGIC + stat.st_size.to_bytes(8, "little") + stat.st_mtime_ns.to_bytes(8, "little"))
+                file.write(self.offsets.tobytes())
+        except OSError:
+            pass
+
+class BinaryCollection(object):
+    """
+    Packed puzzle collection (.sdb). A 32 byte header, magic, record count,
+    record size and flags, followed by fixed size records: the packed puzzle
+    and, if the flags say so, its rating (score * 10, uint16) and the offset
+    of its packed solution (uint64) in the solution section after the records.
+    Missing ratings and solutions are stored as all ones.
+    """
+    MAGIC = b"SDKBIN01"
+    HEADER_SIZE = 32
+    RATING = 1
+    SOLUTION = 2
+    NO_RATING = 0xFFFF
+    NO_SOLUTION = 0xFFFFFFFFFFFFFFFF
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.file = open(file_name, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:8] != self.MAGIC:
+            self.close()
+            raise ValueError("{} is not a packed puzzle collection".format(file_name))
+        self.count = int.from_bytes(self.data[8:16], "little")
+        self.record_size = int.from_bytes(self.data[16:18], "little")
+        self.flags = int.from_bytes(self.data[18:20], "little")
+        self.solutions_start = self.HEADER_SIZE + self.count * self.record_size
+
+    @classmethod
+    def is_binary(cls, file_name: str) -> bool:
+        with open(file_name, "rb") as file:
+            return file.read(len(cls.MAGIC)) == cls.MAGIC
+
+    @classmethod
+    def record_size_for(cls, flags: int) -> int:
+        size = PACKED_SIZE
+        if flags & cls.RATING:
+            size += 2
+        if flags & cls.SOLUTION:
+            size += 8
+        return size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, number: int) -> str:
+        return self.get(number)
+
+    def __record(self, number: int) -> int:
+        if number < 0:
+            number += self.count
+        if not 0 <= number < self.count:
+            raise IndexError("puzzle number out of range")
+        return self.HEADER_SIZE + number * self.record_size
+
+    def get_packed(self, number: int) -> bytes:
+        start = self.__record(number)
+        return self.data[start:start + PACKED_SIZE]
+
+    def get_digits(self, number: int) -> bytes:
+        return unpack_puzzle(self.get_packed(number))
+
+    def get(self, number: int) -> str:
+        return self.get_digits(number).translate(TEXT_DIGITS).decode("ascii")
+
+    def random(self) -> str:
+        return self.get(random.randrange(self.count))
+
+    def get_rating(self, number: int) -> Optional[float]:
+        if not self.flags & self.RATING:
+            return None
+        start = self.__record(number) + PACKED_SIZE
+        rating = int.from_bytes(self.data[start:start + 2], "little")
+        return None if rating == self.NO_RATING else rating / 10
+
+    def get_solution(self, number: int) -> Optional[str]:
+        if not self.flags & self.SOLUTION:
+            return None
+        start = self.__record(number) + self.record_size - 8
+        offset = int.from_bytes(self.data[start:start + 8], "little")
+        if offset == self.NO_SOLUTION:
+            return None
+        start = self.solutions_start + offset
+        return unpack_puzzle(self.data[start:start + PACKED_SIZE]).translate(TEXT_DIGITS).decode("ascii")
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+def write_binary_collection(puzzles: Iterable[str], file_name: str, ratings: Optional[Iterable[Optional[float]]] = None,
+                            solutions: Optional[Iterable[Optional[str]]] = None) -> int:
+    """
+    Packs the puzzles into a .sdb collection, ratings and solutions are
+    optional and are matched to the puzzles in order. Returns the count.
+    """
+    flags = (BinaryCollection.RATING if ratings is not None else 0) | (BinaryCollection.SOLUTION if solutions is not None else 0)
+    rating_iter = iter(ratings) if ratings is not None else None
+    solution_iter = iter(solutions) if solutions is not None else None
+    count = 0
+    with open(file_name, "wb") as out, tempfile.TemporaryFile() as solution_file:
+        out.write(bytes(BinaryCollection.HEADER_SIZE))
+        solution_offset = 0
+        for puzzle in puzzles:
+            record = pack_puzzle(bytes(cell for row in parse_puzzle(puzzle) for cell in row))
+            if rating_iter is not None:
+                rating = next(rating_iter)
+                record += (BinaryCollection.NO_RATING if rating is None else round(rating * 10)).to_bytes(2, "little")
+            if solution_iter is not None:
+                solution = next(solution_iter)
+                if solution is None:
+                    record += BinaryCollection.NO_SOLUTION.to_bytes(8, "little")
+                else:
+                    record += solution_offset.to_bytes(8, "little")
+                    solution_file.write(pack_puzzle(bytes(cell for row in parse_puzzle(solution) for cell in row)))
+                    solution_offset += PACKED_SIZE
+            out.write(record)
+            count += 1
+        solution_file.seek(0)
+        while True:
+            block = solution_file.read(1 << 20)
+            if not block:
+                break
+            out.write(block)
+        out.seek(0)
+        out.write(BinaryCollection.MAGIC + count.to_bytes(8, "little")
+                  + BinaryCollection.record_size_for(flags).to_bytes(2, "little") + flags.to_bytes(2, "little"))
+    return count
+
+def open_collection(file_name: str, persist: bool = False) -> Union[PuzzleCollection, BinaryCollection]:
+    """
+    Opens a collection in either the text or the packed format
+    """
+    if BinaryCollection.is_binary(file_name):
+        return BinaryCollection(file_name)
+    return PuzzleCollection(file_name, persist)
+
+def iter_collection(file_name: str) -> Iterator[str]:
+    """
+    The puzzles of a text or packed collection in order, without loading the whole file
+    """
+    if BinaryCollection.is_binary(file_name):
+        collection = BinaryCollection(file_name)
+        try:
+            for number in range(len(collection)):
+                yield collection.get(number)
+        finally:
+            collection.close()
+    else:
+        with open(file_name) as file:
+            for line in file:
+                line = line.strip()
+                if line:
+                    yield line
+
+def count_cells(value) -> int:
+    """
+    The values in a board structure: nested lists, an array or a single value
+    """
+    if isinstance(value, list):
+        return sum(count_cells(item) for item in value)
+    if isinstance(value, array):
+        return len(value)
+    return 1
+
+class UndoLog(object):
+    """
+    Undo history made of small reversible records, (kind, key, old, new),
+    grouped into transactions. The newest transactions are kept as long as
+    their records hold no more than limit cells of board data together, a
+    limit of 0 turns recording off.
+    """
+    CELL = 0
+    CANDIDATES = 1
+    COLOUR = 2
+    CANDIDATE_COLOUR = 3
+    REPLACE = 4
+
+    def __init__(self, limit: int = 100000):
+        self.limit = limit
+        self.current: list = []
+        self.done: deque = deque()
+        self.undone: List[list] = []
+        self.size = 0
+
+    def record(self, record: tuple):
+        if self.limit:
+            self.current.append(record)
+            if self.undone:
+                self.undone = []
+
+    def commit(self):
+        if not self.current:
+            return
+        self.done.append(self.current)
+        self.size += self.weight(self.current)
+        self.current = []
+        while self.size > self.limit and len(self.done) > 1:
+            self.size -= self.weight(self.done.popleft())
+
+    @staticmethod
+    def weight(transaction: list) -> int:
+        """
+        The cells of board data the records hold. Most records hold one, a
+        REPLACE holds the old and the new version of a whole structure.
+        """
+        return sum(1 if record[0] != UndoLog.REPLACE else count_cells(record[2]) + count_cells(record[3])
+                   for record in transaction)
+
+    def pop_undo(self) -> Optional[list]:
+        if self.current:
+            transaction = self.current
+            self.current = []
+        elif self.done:
+            transaction = self.done.pop()
+            self.size -= self.weight(transaction)
+        else:
+            return None
+        self.undone.append(transaction)
+        return transaction
+
+    def pop_redo(self) -> Optional[list]:
+        if not self.undone:
+            return None
+        self.commit()
+        transaction = self.undone.pop()
+        self.done.append(transaction)
+        self.size += self.weight(transaction)
+        return transaction
+
 class SudokuGame(object):
     """
     A Sudoku game, in charge of storing the state of the board and checking
     whether the puzzle is completed.
     """
 
-    def __init__(self):
+    def __init__(self, undo_limit: int = 100000):
+        # Cells that changed since the UI last asked, so it only redraws those
+        self.changed_cells: Set[int] = set(range(81))
         self.board = SudokuBoard("0" * 81)
         self.puzzle = self.board.get()
         self.start_puzzle = self.board.get()
-        self.candidates = [[set() for x in range(9)] for y in range(9)]
-        self.undostack = deque()
-        self.null_board()
-        self.current_to_origin()
+        self.candidates = empty_candidates()
+        # Zobrist hash of the values and candidates, updated with every change
+        self.zobrist = zobrist_hash(self.puzzle, self.candidates)
+        self.hint_cache = HintCache()
+        # How often each digit is placed in each unit, and the digits placed per unit as a mask
+        self.placed_counts = bytearray(270)
+        self.placed = array('H', bytes(54))
         self.colours = [[0 for i in range(9)] for j in range(9)]
         self.candidate_colours = [[[0 for x in range(10)] for y in range(9)] for z in range(9)]
+        # Setting up the empty board is not something to undo
+        self.undo_log = UndoLog(0)
+        self.null_board()
+        self.current_to_origin()
+        self.undo_log.limit = undo_limit
+        self.collection: Optional[Union[PuzzleCollection, BinaryCollection]] = None
+        # Links between the candidates for the hint engine, synced when a hint is asked for
+        self.links: Optional[LinkGraph] = None
 
     def start(self):
         self.game_over = False
-        self.candidates = [[set() for x in range(9)] for y in range(9)]
-        self.puzzle = []
-        self.colours = [[0 for i in range(9)] for j in range(9)]
-        self.candidate_colours = [[[0 for x in range(10)] for y in range(9)] for z in range(9)]
-
-        for i in range(9):
-            self.puzzle.append([])
-            for j in range(9):
-                self.puzzle[i].append(self.start_puzzle[i][j])
+        self.__replace("candidates", empty_candidates())
+        self.__replace("colours", [[0 for i in range(9)] for j in range(9)])
+        self.__replace("candidate_colours", [[[0 for x in range(10)] for y in range(9)] for z in range(9)])
+        self.__replace("puzzle", [row[:] for row in self.start_puzzle])
         self.board.set_board(self.puzzle)
         self.save_undo_state()
 
     def save_undo_state(self):
-        self.undostack.append((deepcopy(self.puzzle), deepcopy(self.start_puzzle), deepcopy(self.candidates),deepcopy(self.colours), deepcopy(self.candidate_colours)))
+        """
+        Closes the current undo transaction, everything changed since the last
+        call is undone in one step
+        """
+        self.undo_log.commit()
+
+    def pop_changed_cells(self) -> Set[int]:
+        """
+        The indexes of the cells whose value, candidates or colours changed
+        since the last call
+        """
+        changed = self.changed_cells
+        self.changed_cells = set()
+        return changed
+
+    def __replace(self, name: str, value):
+        self.undo_log.record((UndoLog.REPLACE, name, getattr(self, name), value))
+        setattr(self, name, value)
+        self.changed_cells.update(range(81))
+        if name == "puzzle":
+            self.rebuild_placed()
+        if name in ("puzzle", "candidates"):
+            self.zobrist = zobrist_hash(self.puzzle, self.candidates)
+
+    def __write_cell(self, index: int, val: int):
+        self.changed_cells.add(index)
+        row, col = divmod(index, 9)
+        old = self.puzzle[row][col]
+        if old != 0:
+            self.__unplace(row, col, old)
+            self.zobrist ^= ZOBRIST_VALUES[index * 10 + old]
+        self.puzzle[row][col] = val
+        if val != 0:
+            self.__place(row, col, val)
+            self.zobrist ^= ZOBRIST_VALUES[index * 10 + val]
+
+    def __write_mask(self, index: int, mask: int):
+        old = self.candidates[index]
+        if old != mask:
+            self.undo_log.record((UndoLog.CANDIDATES, index, old, mask))
+            self.__set_mask(index, mask)
+
+    def __set_mask(self, index: int, mask: int):
+        for digit in MASK_DIGITS[self.candidates[index] ^ mask]:
+            self.zobrist ^= ZOBRIST_CANDIDATES[index * 9 + digit - 1]
+        self.candidates[index] = mask
+        self.changed_cells.add(index)
+
+    def __apply(self, transaction: list, forward: bool):
+        records = transaction if forward else reversed(transaction)
+        for kind, key, old, new in records:
+            value = new if forward else old
+            if kind == UndoLog.CELL:
+                self.__write_cell(key, value)
+            elif kind == UndoLog.CANDIDATES:
+                self.__set_mask(key, value)
+            elif kind == UndoLog.COLOUR:
+                self.colours[key // 9][key % 9] = value
+                self.changed_cells.add(key)
+            elif kind == UndoLog.CANDIDATE_COLOUR:
+                self.candidate_colours[key // 90][key // 10 % 9][key % 10] = value
+                self.changed_cells.add(key // 10)
+            else:
+                setattr(self, key, value)
+                self.changed_cells.update(range(81))
+                if key == "puzzle":
+                    self.rebuild_placed()
+                if key in ("puzzle", "candidates"):
+                    self.zobrist = zobrist_hash(self.puzzle, self.candidates)
+
+    def snapshot(self) -> "SudokuGame":
+        """
+        A copy of the values and candidates to search on elsewhere, without
+        colours or undo history
+        """
+        copy = SudokuGame(undo_limit=0)
+        copy.start_puzzle = [row[:] for row in self.start_puzzle]
+        copy.puzzle = [row[:] for row in self.puzzle]
+        copy.candidates = array('H', self.candidates)
+        copy.rebuild_placed()
+        copy.zobrist = self.zobrist
+        if self.links is not None:
+            copy.links = self.links.copy()
+        return copy
+
+    def same_position(self, other: "SudokuGame") -> bool:
+        return self.puzzle == other.puzzle and self.candidates == other.candidates
 
     def hint(self) -> str:
-        self.reset_colours()
+        return self.show_hint(self.find_hint())
+
+    def find_hint(self) -> Optional[Hint]:
+        """
+        The hint for the current position, straight from the cache when it
+        was asked for before
+        """
+        if self.zobrist in self.hint_cache:
+            return self.hint_cache.get(self.zobrist)
         hint = HintEngine(self).get_hint()
+        self.hint_cache.put(self.zobrist, hint)
+        return hint
+
+    def show_hint(self, hint: Optional[Hint]) -> str:
+        """
+        Colours the cells and candidates of a hint, returns its technique
+        """
+        self.reset_colours()
 
         if hint is None:
             return
@@ -1104,27 +2210,47 @@ class SudokuGame(object):
         if not hint.cells1 is None:
             for cell in hint.cells1:
                 row, col = cell
-                self.colours[row][col] = 3
+                self.set_cell_colour(row, col, 3, undo=False)
 
         if not hint.cells2 is None:
             for cell in hint.cells2:
                 row, col = cell
-                self.colours[row][col] = 4
+                self.set_cell_colour(row, col, 4, undo=False)
 
         if not hint.good_cands is None:
             for cand in hint.good_cands:
                 row, col, cand = cand
-                self.candidate_colours[row][col][cand] = 1
+                self.set_candidate_colour(row, col, cand, 1, undo=False)
 
         if not hint.bad_cands is None:
             for cand in hint.bad_cands:
                 row, col, cand = cand
-                self.candidate_colours[row][col][cand] = 2
+                self.set_candidate_colour(row, col, cand, 2, undo=False)
 
         return hint.technique
 
+    def apply_hint(self, hint: Hint, undo=True):
+        """
+        Carries out a hint: removes the candidates it eliminates, or sets the
+        cells it solves when there is nothing to eliminate
+        """
+        if hint.bad_cands:
+            for row, col, cand in hint.bad_cands:
+                self.remove_candidate(row, col, cand, undo=False)
+        else:
+            self.set_cells(hint.good_cands, undo=False)
+        if undo:
+            self.save_undo_state()
+
     def undo(self):
-        self.puzzle, self.start_puzzle, self.candidates, self.colours, self.candidate_colours = self.undostack.pop()
+        transaction = self.undo_log.pop_undo()
+        if transaction is not None:
+            self.__apply(transaction, False)
+
+    def redo(self):
+        transaction = self.undo_log.pop_redo()
+        if transaction is not None:
+            self.__apply(transaction, True)
 
     def import_state(self, content: str):
         lines = content.splitlines()
@@ -1165,15 +2291,15 @@ class SudokuGame(object):
                 i += 1
 
         if puzzle_strs:
-            self.start_puzzle = self.__import_2d(puzzle_strs)
+            self.__replace("start_puzzle", self.__import_2d(puzzle_strs))
         if state_strs:
-            self.puzzle = self.__import_2d(state_strs)
+            self.__replace("puzzle", self.__import_2d(state_strs))
         if pencil_mark_strs:
-            self.candidates = self.__import_pms(pencil_mark_strs)
+            self.__replace("candidates", self.__import_pms(pencil_mark_strs))
         if cell_colour_strs:
-            self.colours = self.__import_2d(cell_colour_strs)
+            self.__replace("colours", self.__import_2d(cell_colour_strs))
         if pencil_mark_col_strs:
-            self.candidate_colours = self.__import_pmcs(pencil_mark_col_strs)
+            self.__replace("candidate_colours", self.__import_pmcs(pencil_mark_col_strs))
 
     def __import_pmcs(self, in_strs: List[str]) -> List[List[List[int]]]:
         result = []
@@ -1182,11 +2308,12 @@ class SudokuGame(object):
             result.append([[int(ch) for ch in cands] for cands in candstrs])
         return result
 
-    def __import_pms(self, in_strs: List[str]) -> List[List[set]]:
-        result = []
-        for line in in_strs:
+    def __import_pms(self, in_strs: List[str]) -> array:
+        result = empty_candidates()
+        for row, line in enumerate(in_strs):
             candstrs = line.split(',')
-            result.append([set([int(cand) for cand in cands]) for cands in candstrs])
+            for col, cands in enumerate(candstrs):
+                result[row * 9 + col] = digits_to_mask(int(cand) for cand in cands)
 
         return result
 
@@ -1207,8 +2334,8 @@ class SudokuGame(object):
         state += self.__str_format_2d(self.puzzle)
 
         state += "[PencilMarks]\n"
-        for row in self.candidates:
-            rowstr = ",".join(["".join(sorted([str(cand) for cand in list(cands)])) for cands in row])
+        for row in range(9):
+            rowstr = ",".join(["".join([str(cand) for cand in MASK_DIGITS[mask]]) for mask in self.candidates[row * 9:row * 9 + 9]])
             rowstr += "\n"
             state += rowstr
 
@@ -1241,32 +2368,100 @@ class SudokuGame(object):
         return self.puzzle[row][col]
 
     def set_cell(self, row: int, col: int, val: int, undo=True):
-        self.puzzle[row][col] = val
-        self.candidates[row][col] = set()
+        index = row * 9 + col
+        old = self.puzzle[row][col]
+        if old != val:
+            self.undo_log.record((UndoLog.CELL, index, old, val))
+            self.__write_cell(index, val)
+        self.__write_mask(index, 0)
         self.update_candidates(row, col, undo=False)
         if undo:
             self.save_undo_state()
 
-    def calculate_all_candidates(self):
+    def set_cells(self, cells: Iterable[Tuple[int, int, int]], undo=True):
+        """
+        Sets a batch of (row, col, val) cells with a single undo state
+        """
+        for row, col, val in cells:
+            self.set_cell(row, col, val, undo=False)
+        if undo:
+            self.save_undo_state()
+
+    def propagate_singles(self, undo=True) -> int:
+        """
+        Fills in naked singles until there are none left, including the ones
+        that show up because of earlier placements. Only the peers of a placed
+        cell can become new singles, so those are the ones queued up to check.
+        Returns how many cells were filled.
+        """
+        queue = deque(index for index in range(81) if POPCOUNT[self.candidates[index]] == 1)
+        filled = 0
+        while queue:
+            index = queue.popleft()
+            row, col = CELLS[index]
+            mask = self.candidates[index]
+            if self.puzzle[row][col] != 0 or POPCOUNT[mask] != 1:
+                continue
+            self.set_cell(row, col, LOWEST_DIGIT[mask], undo=False)
+            filled += 1
+            queue.extend(peer for peer in PEER_INDEXES[index] if POPCOUNT[self.candidates[peer]] == 1)
+        if undo and filled:
+            self.save_undo_state()
+        return filled
+
+    def __place(self, row: int, col: int, val: int):
+        bit = DIGIT_BITS[val]
+        for unit in CELL_UNITS[row * 9 + col]:
+            self.placed_counts[unit * 10 + val] += 1
+            self.placed[unit] |= bit
+
+    def __unplace(self, row: int, col: int, val: int):
+        for unit in CELL_UNITS[row * 9 + col]:
+            self.placed_counts[unit * 10 + val] -= 1
+            if self.placed_counts[unit * 10 + val] == 0:
+                self.placed[unit] &= ~DIGIT_BITS[val] & ALL_DIGITS
+
+    def rebuild_placed(self):
+        """
+        Recounts the placed digits, needed whenever the puzzle is replaced as a whole
+        """
+        self.placed_counts = bytearray(270)
+        self.placed = array('H', bytes(54))
+        for row in range(9):
+            for col in range(9):
+                if self.puzzle[row][col] != 0:
+                    self.__place(row, col, self.puzzle[row][col])
+
+    def get_placed_mask(self, row: int, col: int) -> int:
+        box, row_unit, col_unit = CELL_UNITS[row * 9 + col]
+        return self.placed[box] | self.placed[row_unit] | self.placed[col_unit]
+
+    def calculate_all_candidates(self, undo=True):
         for row in range(9):
             for col in range(9):
                 self.calculate_candidates(row, col, undo=False)
-        self.save_undo_state()
+        if undo:
+            self.save_undo_state()
 
     def calculate_candidates(self, row: int, col: int, undo=True):
         if self.puzzle[row][col] == 0:
-            candidates = list(set(range(10)).difference(self.__set_buddies(row, col)))
-            for candidate in candidates:
-                self.add_candidate(row, col, candidate, undo=False)
+            index = row * 9 + col
+            self.__write_mask(index, self.candidates[index] | (ALL_DIGITS & ~self.get_placed_mask(row, col)))
 
         if undo:
             self.save_undo_state()
 
 
-    def get_candidates(self, row: int, col: int) -> List[int]:
-        return list(self.candidates[row][col])
+    def get_candidates(self, row: int, col: int) -> Tuple[int, ...]:
+        return MASK_DIGITS[self.candidates[row * 9 + col]]
+
+    def get_candidate_mask(self, row: int, col: int) -> int:
+        return self.candidates[row * 9 + col]
+
+    def has_candidate(self, row: int, col: int, val: int) -> bool:
+        return self.candidates[row * 9 + col] & DIGIT_BITS[val] != 0
 
-    def get_candidate_set(self, row: int, col: int) -> List[int]:
+    def get_candidate_set(self, row: int, col: int) -> array:
         return self.candidates
 
     def get_cell_colour(self, row: int, col: int) -> str:
@@ -1276,35 +2471,50 @@ class SudokuGame(object):
         return COLOURS[self.candidate_colours[row][col][candidate]]
 
     def set_candidate_colour(self, row: int, col: int, candidate: int, colour_number: int, undo=True):
-        self.candidate_colours[row][col][candidate] = colour_number
+        old = self.candidate_colours[row][col][candidate]
+        if old != colour_number:
+            self.undo_log.record((UndoLog.CANDIDATE_COLOUR, (row * 9 + col) * 10 + candidate, old, colour_number))
+            self.candidate_colours[row][col][candidate] = colour_number
+            self.changed_cells.add(row * 9 + col)
         if undo:
             self.save_undo_state()
 
     def set_cell_colour(self, row: int, col: int, colour_number: int, undo=True):
-        self.colours[row][col] = colour_number
+        old = self.colours[row][col]
+        if old != colour_number:
+            self.undo_log.record((UndoLog.COLOUR, row * 9 + col, old, colour_number))
+            self.colours[row][col] = colour_number
+            self.changed_cells.add(row * 9 + col)
         if undo:
             self.save_undo_state()
 
 
     def toggle_candidate(self, row: int, col: int, val: int, undo=True):
-        if val not in self.candidates[row][col]:
-            self.candidates[row][col].add(val)
-        else:
-            self.candidates[row][col].remove(val)
+        index = row * 9 + col
+        self.__write_mask(index, self.candidates[index] ^ DIGIT_BITS[val])
         if undo:
             self.save_undo_state()
 
     def reset_colours(self):
-        self.colours = [[0 for i in range(9)] for j in range(9)]
-        self.candidate_colours = [[[0 for x in range(10)] for y in range(9)] for z in range(9)]
+        # Only the colours that are set get an undo record
+        for row in range(9):
+            for col in range(9):
+                if self.colours[row][col] != 0:
+                    self.set_cell_colour(row, col, 0, undo=False)
+                if any(self.candidate_colours[row][col]):
+                    for candidate in range(10):
+                        if self.candidate_colours[row][col][candidate] != 0:
+                            self.set_candidate_colour(row, col, candidate, 0, undo=False)
 
     def remove_candidate(self, row: int, col: int, val: int, undo=True):
-        self.candidates[row][col].discard(val)
+        index = row * 9 + col
+        self.__write_mask(index, self.candidates[index] & ~DIGIT_BITS[val])
         if undo:
             self.save_undo_state()
 
     def add_candidate(self, row: int, col: int, val: int, undo=True):
-        self.candidates[row][col].add(val)
+        index = row * 9 + col
+        self.__write_mask(index, self.candidates[index] | DIGIT_BITS[val])
         if undo:
             self.save_undo_state()
 
@@ -1317,7 +2527,7 @@ class SudokuGame(object):
 
     def set_forum_string(self, forum_string: str):
         new_origin = [[0 for col in range(9)] for row in range(9)]
-        new_candidates: List[List[set]] = [[set() for x in range(9)] for y in range(9)]
+        new_candidates = empty_candidates()
         tmp_cands = []
         for line in forum_string.splitlines():
             line.strip()
@@ -1337,11 +2547,11 @@ class SudokuGame(object):
                 if len(cur_cands) == 1:
                     new_origin[row][col] = cur_cands[0]
                 else:
-                    new_candidates[row][col].update(set(cur_cands))
+                    new_candidates[row * 9 + col] |= digits_to_mask(cur_cands)
 
-        self.start_puzzle = new_origin
-        self.puzzle = new_origin
-        self.candidates = new_candidates
+        self.__replace("start_puzzle", new_origin)
+        self.__replace("puzzle", [row[:] for row in new_origin])
+        self.__replace("candidates", new_candidates)
 
     def get_forum_string(self) -> str:
         forum_string = ""
@@ -1443,84 +2653,78 @@ class SudokuGame(object):
         return result
 
     def update_candidates(self, row: int, col: int, undo=True):
-        answer = self.puzzle[row][col]
-        buddies = self.__find_buddies(row, col)
-        for r, c in buddies:
-            self.remove_candidate(r, c, answer, undo=False)
+        keep = ~DIGIT_BITS[self.puzzle[row][col]] & ALL_DIGITS
+        for index in PEER_INDEXES[row * 9 + col]:
+            if self.candidates[index] & ~keep:
+                self.__write_mask(index, self.candidates[index] & keep)
         if undo:
             self.save_undo_state()
 
-    def __find_buddies(self, row: int, col: int) -> List[Tuple[int, int]]:
-        buddies = []
-        # Row buddies
-        buddies.extend([(row, c) for c in range(9)])
-        # Column buddies
-        buddies.extend([(r, col) for r in range(9)])
-        # Box buddies
-        box_row = row // 3
-        box_col = col // 3
-        buddies.extend([
-                (r, c)
-                for r in range(box_row * 3, (box_row + 1) * 3)
-                for c in range(box_col * 3, (box_col + 1) * 3)
-        ])
-        return buddies
+    def count_solutions(self, limit: int = 2) -> int:
+        return SudokuSolver(self.puzzle).count_solutions(limit)
 
     def current_to_origin(self):
         self.game_over = False
-        self.start_puzzle = []
-        for i in range(9):
-            self.start_puzzle.append([])
-            for j in range(9):
-                self.start_puzzle[i].append(self.puzzle[i][j])
+        self.__replace("start_puzzle", [row[:] for row in self.puzzle])
         self.save_undo_state()
 
     def null_board(self):
-        for i in range(9):
-            for j in range(9):
-                self.start_puzzle[i][j] = 0
+        self.__replace("start_puzzle", [[0 for j in range(9)] for i in range(9)])
         self.start()
 
+    def get_collection(self, file_name: str, persist: bool = False) -> Union[PuzzleCollection, BinaryCollection]:
+        if self.collection is None or self.collection.file_name != file_name:
+            if self.collection is not None:
+                self.collection.close()
+            self.collection = open_collection(file_name, persist)
+        return self.collection
+
     def load_puzzle(self, file_name: str, line_number: int):
-        with open(file_name) as file:
-            puzzles = [line.strip() for line in file]
-            self.from_string(puzzles[line_number])
+        self.from_string(self.get_collection(file_name).get(line_number))
         self.save_undo_state()
 
-    def generate(self, difficulty: str):
-        self.board.generate(difficulty)
-        self.start_puzzle = self.board.get()
+    def generate(self, difficulty: str, puzzle: Optional[str] = None) -> bool:
+        """
+        Starts a new puzzle of the difficulty, False when none could be made
+        (see SudokuBoard.generate) and the game is left as it was
+        """
+        # A puzzle made elsewhere, e.g. by a PuzzleGeneration, is started as is
+        if puzzle is None:
+            if not self.board.generate(difficulty):
+                return False
+        else:
+            self.board.update(puzzle)
+        self.__replace("start_puzzle", self.board.get())
         self.start()
+        return True
 
     def rotate90(self):
         self.board.rotate90()
-        self.start_puzzle = self.board.get()
+        self.__replace("start_puzzle", self.board.get())
         self.start()
 
     def flip_hor(self):
         self.board.flip_hor()
-        self.start_puzzle = self.board.get()
+        self.__replace("start_puzzle", self.board.get())
         self.start()
 
     def flip_vert(self):
         self.board.flip_vert()
-        self.start_puzzle = self.board.get()
+        self.__replace("start_puzzle", self.board.get())
         self.start()
 
     def translate(self):
         self.board.translate()
-        self.start_puzzle = self.board.get()
+        self.__replace("start_puzzle", self.board.get())
         self.start()
 
     def load_random_puzzle(self, file_name: str):
-        with open(file_name) as file:
-            puzzles = [line.strip() for line in file]
-            self.from_string(random.choice(puzzles))
+        self.from_string(self.get_collection(file_name).random())
         self.save_undo_state()
 
     def from_string(self, puzzle_string: str):
         self.board.update(puzzle_string)
-        self.start_puzzle = self.board.get()
+        self.__replace("start_puzzle", self.board.get())
         self.start()
         self.save_undo_state()
 
@@ -1544,17 +2748,11 @@ class SudokuGame(object):
     def __check_row(self, row: int) -> bool:
         return self.__check_group(self.puzzle[row])
 
-    def __set_row(self, row: int) -> set:
-        return set(self.puzzle[row])
-
     def __check_column(self, col: int) -> bool:
         return self.__check_group(
             [self.puzzle[row][col] for row in range(9)]
         )
 
-    def __set_column(self, col: int) -> set:
-        return set([self.puzzle[row][col] for row in range(9)])
-
     def __check_square(self, row: int, col: int) -> bool:
         return self.__check_group(
             [
@@ -1564,24 +2762,426 @@ class SudokuGame(object):
             ]
         )
 
-    def __set_square(self, box_row: int, box_col: int) -> set:
-        return set(
-            [
-                self.puzzle[r][c]
-                for r in range(box_row * 3, (box_row + 1) * 3)
-                for c in range(box_col * 3, (box_col + 1) * 3)
-            ]
-        )
 
-    def __set_buddies(self, row: int, col: int) -> set:
-        return self.__set_row(row).union(self.__set_column(col), self.__set_square(row // 3, col // 3))
+# Difficulty of the techniques, roughly following the Sudoku Explainer scale
+TECHNIQUE_SCORES = {
+    "hidden_single": 1.5,
+    "naked_single": 2.3,
+    "pointing": 2.6,
+    "box_line_reduction": 2.8,
+    "naked_pair": 3.0,
+    "xwings": 3.2,
+    "hidden_pair": 3.4,
+    "naked_triple": 3.6,
+    "swordfish": 3.8,
+    "hidden_triple": 4.0,
+    "skyscrapers": 4.0,
+    "finned_xwings": 4.2,
+    "simple_colouring": 4.4,
+    "finned_swordfish": 4.6,
+    "x_chains": 4.8,
+    "naked_quad": 5.0,
+    "xy_chains": 5.0,
+    "jellyfish": 5.2,
+    "hidden_quad": 5.4,
+    "finned_jellyfish": 5.6,
+    "aic": 6.0,
+}
+# Highest score that still gets the label, anything we get stuck on is Extreme
+DIFFICULTY_LIMITS = (("Easy", 2.3), ("Medium", 3.0), ("Hard", 4.0), ("Unfair", 5.4))
+
+DIFFICULTIES = tuple(name for name, limit in DIFFICULTY_LIMITS) + ("Extreme",)
+
+Rating = namedtuple('Rating', "solved score difficulty hardest steps")
+
+def rate_puzzle(puzzle_string: str, stats: Optional[EngineStats] = None) -> Rating:
+    """
+    Solves the puzzle with the HintEngine techniques only, and rates it by the
+    hardest technique that was needed
+    """
+    game = SudokuGame(undo_limit=0)
+    game.from_string(puzzle_string)
+    game.calculate_all_candidates()
+    score = 0.0
+    hardest = ""
+    steps = 0
+    while True:
+        engine = HintEngine(game, stats=stats)
+        # Easiest technique first, so a step is never rated harder than it needs
+        engine.techs.sort(key=lambda tech: TECHNIQUE_SCORES[tech.__name__.lstrip("_")])
+        hint = engine.get_hint()
+        if hint is None:
+            break
+        steps += 1
+        technique_score = TECHNIQUE_SCORES.get(engine.technique_name, 0.0)
+        if technique_score > score:
+            score = technique_score
+            hardest = engine.technique_name
+        game.apply_hint(hint, undo=False)
+
+    solved = all(game.get_cell(row, col) != 0 for row in range(9) for col in range(9))
+    difficulty = "Extreme"
+    if solved:
+        for name, limit in DIFFICULTY_LIMITS:
+            if score <= limit:
+                difficulty = name
+                break
+    return Rating(solved, score, difficulty, hardest, steps)
+
+def rate_chunk(puzzles: List[str]) -> List[Rating]:
+    return [rate_puzzle(puzzle) for puzzle in puzzles]
+
+def rate_chunk_with_stats(puzzles: List[str]) -> Tuple[List[Rating], EngineStats]:
+    # The stats of every worker travel back with its ratings to be added up
+    stats = EngineStats()
+    return [rate_puzzle(puzzle, stats) for puzzle in puzzles], stats
+
+def batch_rate(file_names: List[str], out: TextIO, processes: int = 0, chunk_size: int = 32,
+               stats: Optional[EngineStats] = None) -> Tuple[Counter, float]:
+    """
+    Rates every puzzle of the collections, writing one tab separated line per
+    puzzle. Returns how many puzzles got each difficulty and the seconds it took.
+    The technique counters of all workers are added to stats when it's given.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    start = time.perf_counter()
+    difficulties: Counter = Counter()
+    pool = worker_pool(processes)
+    try:
+        for file_name in file_names:
+            # The chunks go to the workers and, tee'd, to the output as their results come back
+            chunks, puzzle_chunks = it.tee(read_chunks(iter_collection(file_name), chunk_size))
+            if stats is None:
+                results = map_chunks(rate_chunk, chunks, processes, pool)
+            else:
+                results = map_chunks(rate_chunk_with_stats, chunks, processes, pool)
+            for puzzles, ratings in zip(puzzle_chunks, results):
+                if stats is not None:
+                    ratings, chunk_stats = ratings
+                    stats.merge(chunk_stats)
+                for puzzle, rating in zip(puzzles, ratings):
+                    state = "solved" if rating.solved else "stuck"
+                    out.write("{}\t{:.1f}\t{}\t{}\t{}\t{}\n".format(puzzle, rating.score, rating.difficulty, rating.hardest or "-", rating.steps, state))
+                    difficulties[rating.difficulty] += 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return difficulties, time.perf_counter() - start
+
+def random_grid(rng: random.Random) -> List[int]:
+    """
+    A random solved grid. The three boxes on the diagonal don't share a unit,
+    so they are filled with random permutations and the solver does the rest.
+    """
+    grid = [0] * 81
+    for box in (0, 4, 8):
+        digits = list(range(1, 10))
+        rng.shuffle(digits)
+        for (row, col), digit in zip(BOX_CELLS[box], digits):
+            grid[row * 9 + col] = digit
+    solution = SudokuSolver([grid[row * 9:row * 9 + 9] for row in range(9)]).solve()
+    return [int(digit) for digit in solution]
+
+def generate_puzzle(difficulty: str, symmetric: bool = False, rng: Optional[random.Random] = None) -> Optional[Tuple[str, Rating]]:
+    """
+    Removes clues from a random solved grid in random order, every removal has
+    to keep the solution unique and must not make the puzzle harder than the
+    difficulty. Returns the puzzle and its rating once no more clues can be
+    removed, or None if it didn't end up at the difficulty.
+    With symmetric the clues are removed in pairs mirrored through the centre.
+    """
+    rng = rng or random.Random()
+    target = DIFFICULTIES.index(difficulty)
+    grid = random_grid(rng)
+    cells = list(range(41 if symmetric else 81))
+    rng.shuffle(cells)
+    rating = rate_puzzle("".join(map(str, grid)))
+    for cell in cells:
+        removed = {cell, 80 - cell} if symmetric else {cell}
+        digits = {index: grid[index] for index in removed}
+        for index in removed:
+            grid[index] = 0
+        puzzle = "".join(map(str, grid))
+        if SudokuSolver(puzzle).is_unique():
+            # Anything we get stuck on is already Extreme, no need to rate it again
+            if target == len(DIFFICULTIES) - 1 and not rating.solved:
+                continue
+            new_rating = rate_puzzle(puzzle)
+            if DIFFICULTIES.index(new_rating.difficulty) <= target:
+                rating = new_rating
+                continue
+        for index, digit in digits.items():
+            grid[index] = digit
+    if rating.difficulty != difficulty:
+        return None
+    return "".join(map(str, grid)).replace("0", "."), rating
+
+def generate_chunk(difficulties: List[str], symmetric: bool = False) -> List[Optional[Tuple[str, Rating]]]:
+    # Every worker needs its own random state, forked ones would all start from the same
+    rng = random.Random()
+    return [generate_puzzle(difficulty, symmetric, rng) for difficulty in difficulties]
+
+def generate_symmetric_chunk(difficulties: List[str]) -> List[Optional[Tuple[str, Rating]]]:
+    return generate_chunk(difficulties, True)
+
+def batch_generate(difficulties: List[str], count: int, out: TextIO, symmetric: bool = False,
+                   processes: int = 0, chunk_size: int = 4) -> Dict[str, Tuple[int, int, float]]:
+    """
+    Generates count puzzles of every difficulty and writes them to out, one
+    .seed line each. Returns difficulty to (puzzles, attempts, seconds).
+    """
+    processes = processes or multiprocessing.cpu_count()
+    func = generate_chunk if not symmetric else generate_symmetric_chunk
+    stats = {}
+    pool = worker_pool(processes)
+    try:
+        for difficulty in difficulties:
+            start = time.perf_counter()
+            found = 0
+            attempts = 0
+            while found < count:
+                # Keep every worker busy with a few chunks per round
+                chunks = [[difficulty] * chunk_size for _ in range(processes * 2)]
+                for results in map_chunks(func, chunks, processes, pool):
+                    attempts += len(results)
+                    for result in results:
+                        if result is not None and found < count:
+                            out.write(result[0] + "\n")
+                            found += 1
+                out.flush()
+            stats[difficulty] = (found, attempts, time.perf_counter() - start)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return stats
+
+def first_row_orders(values: List[int]) -> Tuple[Tuple[int, ...], List[Tuple[int, ...]]]:
+    """
+    The smallest empty/filled pattern a row can get from reordering the stacks
+    and the columns inside them, and every column order that gives it
+    """
+    stacks = [[col for col in range(stack * 3, stack * 3 + 3) if values[col] == 0] for stack in range(3)]
+    filled = [[col for col in range(stack * 3, stack * 3 + 3) if values[col] != 0] for stack in range(3)]
+    counts = [len(cols) for cols in filled]
+    pattern = tuple(cell for count in sorted(counts) for cell in [0] * (3 - count) + [1] * count)
+    orders = []
+    for stack_order in it.permutations(range(3)):
+        if any(counts[stack_order[i]] > counts[stack_order[i + 1]] for i in range(2)):
+            continue
+        # Empty columns go first in every stack, in any order among themselves
+        choices = [
+            [empty + full for empty in it.permutations(stacks[stack]) for full in it.permutations(filled[stack])]
+            for stack in stack_order
+        ]
+        for first, second, third in it.product(*choices):
+            orders.append(first + second + third)
+    return pattern, orders
+
+def relabel_row(values: List[int], order: Tuple[int, ...], labels: List[int]) -> Tuple[Tuple[int, ...], List[int]]:
+    """
+    The row in the given column order with the digits numbered by first
+    appearance. labels[digit] is the number given so far, labels[0] the count.
+    """
+    labels = labels[:]
+    row = []
+    for col in order:
+        digit = values[col]
+        if digit == 0:
+            row.append(0)
+            continue
+        if labels[digit] == 0:
+            labels[0] += 1
+            labels[digit] = labels[0]
+        row.append(labels[digit])
+    return tuple(row), labels
+
+def canonical_form(puzzle_string: str) -> str:
+    """
+    The smallest form of the puzzle under every change that keeps a sudoku
+    valid: transposing, reordering bands and stacks, rows and columns inside
+    them, and renaming the digits. Digits are renamed by first appearance, so
+    all disguises of a puzzle (rotate90, flip_*, translate...) give the same
+    form. Built a row at a time, keeping only the ways of getting there that
+    are still tied for the smallest.
+    """
+    grid = parse_puzzle(puzzle_string)
+    grids = (grid, [list(col) for col in zip(*grid)])
+
+    # Its digits are all different, so the first row only depends on which cells are empty
+    best_pattern = None
+    states = []
+    for grid in grids:
+        for row in range(9):
+            pattern, orders = first_row_orders(grid[row])
+            if best_pattern is not None and pattern > best_pattern:
+                continue
+            if pattern != best_pattern:
+                best_pattern = pattern
+                states = []
+            for order in orders:
+                states.append((grid, (row,), order, relabel_row(grid[row], order, [0] * 10)[1]))
+    form = list(relabel_row(states[0][0][states[0][1][0]], states[0][2], [0] * 10)[0])
+
+    for position in range(1, 9):
+        best = None
+        next_states = []
+        for grid, rows, order, labels in states:
+            band = rows[-1] // 3
+            if position % 3:
+                candidates = [row for row in range(band * 3, band * 3 + 3) if row not in rows]
+            else:
+                bands = set(row // 3 for row in rows)
+                candidates = [row for row in range(9) if row // 3 not in bands]
+            for row in candidates:
+                values, new_labels = relabel_row(grid[row], order, labels)
+                if best is not None and values > best:
+                    continue
+                if values != best:
+                    best = values
+                    next_states = []
+                next_states.append((grid, rows + (row,), order, new_labels))
+        states = next_states
+        form.extend(best)
+    return "".join(map(str, form)).replace("0", ".")
+
+def canonical_hash(puzzle_string: str) -> int:
+    """
+    64 bit hash of the canonical form, the same on every run and machine
+    """
+    digest = hashlib.blake2b(canonical_form(puzzle_string).encode("ascii"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
 
+def canonical_chunk(puzzles: List[str]) -> List[int]:
+    return [canonical_hash(puzzle) for puzzle in puzzles]
+
+def find_duplicates(file_names: List[str], processes: int = 0, chunk_size: int = 64,
+                    buckets: int = 64) -> Tuple[List[List[Tuple[int, int]]], int]:
+    """
+    Clusters of equivalent puzzles over the collections, as lists of
+    (file number, puzzle number). Memory stays bounded: the hashes are spread
+    over bucket files by their top bits and each bucket is grouped on its own.
+    Returns the clusters and the number of puzzles.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    bucket_files = [tempfile.TemporaryFile() for _ in range(buckets)]
+    count = 0
+    pool = worker_pool(processes)
+    try:
+        for file_number, file_name in enumerate(file_names):
+            number = 0
+            for hashes in map_chunks(canonical_chunk, read_chunks(iter_collection(file_name), chunk_size), processes, pool):
+                for puzzle_hash in hashes:
+                    record = puzzle_hash.to_bytes(8, "little") + file_number.to_bytes(2, "little") + number.to_bytes(4, "little")
+                    bucket_files[(puzzle_hash >> 56) * buckets >> 8].write(record)
+                    number += 1
+            count += number
+
+        clusters = []
+        for bucket_file in bucket_files:
+            bucket_file.seek(0)
+            data = bucket_file.read()
+            groups: Dict[bytes, List[Tuple[int, int]]] = {}
+            for start in range(0, len(data), 14):
+                groups.setdefault(data[start:start + 8], []).append(
+                    (int.from_bytes(data[start + 8:start + 10], "little"), int.from_bytes(data[start + 10:start + 14], "little"))
+                )
+            clusters.extend(sorted(members) for members in groups.values() if len(members) > 1)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        for bucket_file in bucket_files:
+            bucket_file.close()
+    clusters.sort()
+    return clusters, count
+
+BENCHMARK_FILES = ("Easy.seed", "Medium.seed", "Hard.seed", "Unfair.seed", "Extreme.seed",
+                   "easy.sdm", "medium.sdm", "hard.sdm", "very_hard.sdm")
+
+def benchmark_sample(file_name: str, size: int) -> List[str]:
+    """
+    size puzzles spread evenly over the collection, the same ones every run
+    """
+    puzzles = [puzzle for puzzle in iter_collection(file_name) if puzzle]
+    step = max(len(puzzles) // size, 1)
+    return puzzles[::step][:size]
 
-class SudokuUI(tk.Frame):
+def percentiles(times: List[float]) -> Dict[str, float]:
+    """
+    Summary of a list of timings in seconds, reported in microseconds
+    """
+    times = sorted(times)
+    def at(fraction: float) -> float:
+        return round(times[min(int(fraction * len(times)), len(times) - 1)] * 1e6, 1)
+    return {
+        "count": len(times),
+        "mean": round(sum(times) / len(times) * 1e6, 1),
+        "p50": at(0.5),
+        "p90": at(0.9),
+        "p99": at(0.99),
+        "max": round(times[-1] * 1e6, 1),
+    }
+
+def benchmark(file_names: Iterable[str], size: int = 50, rounds: int = 3) -> Dict:
+    """
+    Times calculating the candidates, get_hint and every technique on its
+    own over a fixed sample of each collection. Each puzzle is timed rounds
+    times and the fastest counts, which keeps out most of the noise.
+    """
+    samples = {file_name: benchmark_sample(file_name, size) for file_name in file_names}
+    timings: Dict[str, List[float]] = {}
+
+    def record(name: str, func: Callable, setup: Optional[Callable] = None):
+        best = None
+        for _ in range(rounds):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        timings.setdefault(name, []).append(best)
+
+    for puzzles in samples.values():
+        for puzzle in puzzles:
+            game = SudokuGame(undo_limit=0)
+            game.from_string(puzzle)
+            record("candidates", game.calculate_all_candidates, lambda: setattr(game, "candidates", empty_candidates()))
+            # The link graph is kept on the game, dropping it times building it as well
+            reset_links = lambda: setattr(game, "links", None)
+            record("get_hint", lambda: HintEngine(game).get_hint(), reset_links)
+            for number, tech in enumerate(HintEngine(game).techs):
+                # A fresh engine every time, its lookups are built as the techniques need them
+                record(tech.__name__.lstrip("_"), lambda: HintEngine(game).techs[number](), reset_links)
+
+    return {
+        "python": sys.version.split()[0],
+        "rounds": rounds,
+        "samples": {file_name: len(puzzles) for file_name, puzzles in samples.items()},
+        "timings": {name: percentiles(times) for name, times in timings.items()},
+    }
+
+def compare_benchmark(results: Dict, baseline: Dict, threshold: float, metric: str = "p50") -> List[str]:
+    """
+    The timings that got slower than threshold times their baseline value
+    """
+    regressions = []
+    for name, timing in results["timings"].items():
+        before = baseline.get("timings", {}).get(name)
+        if before is None or before[metric] <= 0:
+            continue
+        ratio = timing[metric] / before[metric]
+        if ratio > threshold:
+            regressions.append("{}: {} {:.1f}us -> {:.1f}us ({:.2f}x)".format(name, metric, before[metric], timing[metric], ratio))
+    return regressions
+
+
+# Without tkinter the class is still there, but run_gui() won't start
+class SudokuUI(tk.Frame if tk is not None else object):
     """
     The Tkinter UI, responsible for drawing the board and accepting user input.
     """
-    def __init__(self, parent: tk.Tk, game: SudokuGame):
+    def __init__(self, parent: "tk.Tk", game: SudokuGame):
         self.game = game
         self.parent = parent
         tk.Frame.__init__(self, parent)
@@ -1601,6 +3201,16 @@ class SudokuUI(tk.Frame):
         self.technique = ""
         self.autosolve_naked_singles = tk.BooleanVar(value=False)
 
+        # Canvas items of every cell are made once and then only changed,
+        # cell_states holds what each cell shows right now
+        self.cell_items: List[Tuple[int, int, int, List[int], List[int]]] = []
+        self.cell_states: List[tuple] = []
+        self.drawn_highlight = None
+        self.resize_job: Optional[str] = None
+        self.hint_search: Optional[HintSearch] = None
+        self.generation: Optional[PuzzleGeneration] = None
+        self.engine_stats = EngineStats()
+
         self.__initUI()
 
     def __initUI(self):
@@ -1621,6 +3231,7 @@ class SudokuUI(tk.Frame):
         puzzlemenu = tk.Menu(menubar, tearoff=0)
         puzzlemenu.add_command(label="Calculate candidates", command=self.__calculate_candidates)
         puzzlemenu.add_command(label="Get hint", command=self.__hint)
+        puzzlemenu.add_command(label="Cancel hint", command=self.__cancel_hint)
         puzzlemenu.add_checkbutton(label="Autosolve naked singles", onvalue=True, offvalue=0, variable=self.autosolve_naked_singles)
         puzzlemenu.add_command(label="Reset", command=self.__clear_answers)
         puzzlemenu.add_command(label="Clear", command=self.__null_board)
@@ -1644,13 +3255,14 @@ class SudokuUI(tk.Frame):
         debugmenu.add_command(label="flip horizontal", command=self.__flip_hor)
         debugmenu.add_command(label="flip vertical", command=self.__flip_vert)
         debugmenu.add_command(label="translate", command=self.__translate)
+        debugmenu.add_command(label="Show engine stats", command=self.__show_engine_stats)
         menubar.add_cascade(label="Debug", menu=debugmenu)
         self.parent.config(menu=menubar)
 
         self.canvas = tk.Canvas(self, width=WIDTH, height=HEIGHT)
         self.canvas.pack(fill=tk.BOTH, expand=True)
 
-        self.__draw_grid()
+        self.__create_items()
         self.__draw_puzzle()
         self.__draw_cursor()
         self.canvas.focus_set()
@@ -1666,11 +3278,13 @@ class SudokuUI(tk.Frame):
         self.canvas.bind("<s>", self.__cursor_down)
 
         self.canvas.bind("<u>", self.__undo)
+        self.canvas.bind("<r>", self.__redo)
         self.canvas.bind("<q>", self.__toggle_mode_colouring)
         self.canvas.bind("<e>", self.__erase_colouring)
         self.canvas.bind("<f>", self.__toggle_mode_colour_candidate)
         self.canvas.bind("<c>", self.__calculate_candidates)
         self.canvas.bind("<h>", self.__hint)
+        self.canvas.bind("<Escape>", self.__cancel_hint)
 
         self.canvas.bind("<Control-v>", self.__from_clip)
 
@@ -1694,24 +3308,59 @@ class SudokuUI(tk.Frame):
         self.__draw_puzzle()
 
     def __hint(self, event=None):
-        self.technique = self.game.hint()
-        self.highlight = 0
+        # A newer request makes the running one stale
+        if self.hint_search is not None:
+            self.hint_search.cancel()
+            self.hint_search = None
+        if self.game.zobrist in self.game.hint_cache:
+            self.technique = self.game.show_hint(self.game.hint_cache.get(self.game.zobrist)) or "none found"
+            self.highlight = 0
+            self.__draw_puzzle()
+            return
+        self.hint_search = HintSearch(self.game)
+        self.technique = "searching... (Esc to cancel)"
         self.__draw_puzzle()
+        self.after(HINT_POLL, self.__check_hint, self.hint_search)
 
-    def __autofill_naked_singles(self):
-        hint = HintEngine(self.game).get_naked()
-        if hint is None:
+    def __check_hint(self, search: HintSearch):
+        if search is not self.hint_search:
+            return
+        if not search.done.is_set():
+            self.after(HINT_POLL, self.__check_hint, search)
             return
+        self.hint_search = None
+        self.engine_stats.merge(search.stats)
+        self.game.hint_cache.put(search.snapshot.zobrist, search.hint)
+        # Keep the links of the search, the next snapshot only syncs what changed since
+        if search.snapshot.links is not None:
+            self.game.links = search.snapshot.links
+        if not self.game.same_position(search.snapshot):
+            # The board changed while searching, the hint may not fit anymore
+            self.technique = ""
         else:
-            for row, col, val in hint.good_cands:
-                self.game.set_cell(row, col, val, undo=False)
+            self.technique = self.game.show_hint(search.hint) or "none found"
+            self.highlight = 0
+        self.__draw_puzzle()
 
+    def __cancel_hint(self, event=None):
+        if self.hint_search is None and self.generation is None:
+            return
+        for search in (self.hint_search, self.generation):
+            if search is not None:
+                search.cancel()
+        self.hint_search = None
+        self.generation = None
+        self.technique = ""
         self.__draw_puzzle()
 
     def __undo(self, event):
         self.game.undo()
         self.__draw_puzzle()
 
+    def __redo(self, event):
+        self.game.redo()
+        self.__draw_puzzle()
+
     def __save_state_as(self):
         file = filedialog.asksaveasfile(mode='w', defaultextension=".sdk")
         if file is None:
@@ -1720,35 +3369,49 @@ class SudokuUI(tk.Frame):
         file.write(content)
         file.close()
 
-    def __generate_easy(self):
-        self.game.generate("Easy")
-        self.file_name = "Easy.seed"
+    def __generate(self, difficulty: str):
+        # The new puzzle makes a running hint search or generation stale
+        self.__cancel_hint()
+        if SudokuBoard.seed_file(difficulty) is None:
+            # Making a puzzle from scratch takes too long for the main thread
+            self.generation = PuzzleGeneration(difficulty)
+            self.technique = "generating {} puzzle... (Esc to cancel)".format(difficulty)
+            self.__draw_puzzle()
+            self.after(HINT_POLL, self.__check_generation, self.generation)
+            return
+        self.game.generate(difficulty)
+        self.__generated(difficulty)
+
+    def __check_generation(self, generation: PuzzleGeneration):
+        if generation is not self.generation:
+            return
+        if not generation.done.is_set():
+            self.after(HINT_POLL, self.__check_generation, generation)
+            return
+        self.generation = None
+        self.game.generate(generation.difficulty, generation.puzzle)
+        self.__generated(generation.difficulty)
+
+    def __generated(self, difficulty: str):
+        self.file_name = difficulty + ".seed"
         self.puzzle_num = 0
+        self.technique = ""
         self.__draw_puzzle()
 
+    def __generate_easy(self):
+        self.__generate("Easy")
+
     def __generate_medium(self):
-        self.game.generate("Medium")
-        self.file_name = "Medium.seed"
-        self.puzzle_num = 0
-        self.__draw_puzzle()
+        self.__generate("Medium")
 
     def __generate_hard(self):
-        self.game.generate("Hard")
-        self.file_name = "Hard.seed"
-        self.puzzle_num = 0
-        self.__draw_puzzle()
+        self.__generate("Hard")
 
     def __generate_unfair(self):
-        self.game.generate("Unfair")
-        self.file_name = "Unfair.seed"
-        self.puzzle_num = 0
-        self.__draw_puzzle()
+        self.__generate("Unfair")
 
     def __generate_extreme(self):
-        self.game.generate("Extreme")
-        self.file_name = "Extreme.seed"
-        self.puzzle_num = 0
-        self.__draw_puzzle()
+        self.__generate("Extreme")
 
     def __rotate90(self):
         self.game.rotate90()
@@ -1762,12 +3425,21 @@ class SudokuUI(tk.Frame):
         self.game.flip_vert()
         self.__draw_puzzle()
 
+    def __show_engine_stats(self):
+        if not self.engine_stats.techniques:
+            messagebox.showinfo("Engine stats", "No hints have been searched yet")
+            return
+        messagebox.showinfo("Engine stats", str(self.engine_stats))
+
     def __translate(self):
         self.game.translate()
         self.__draw_puzzle()
 
     def __from_file(self):
-        self.file_name = filedialog.askopenfilename(title="Open puzzle collection")
+        file_name = filedialog.askopenfilename(title="Open puzzle collection")
+        if not file_name:
+            return
+        self.file_name = file_name
         self.puzzle_num = 0
         self.game.load_puzzle(self.file_name, self.puzzle_num)
         self.__draw_puzzle()
@@ -1783,6 +3455,10 @@ class SudokuUI(tk.Frame):
     def __goto_puzzle(self):
         in_num = tkinter.simpledialog.askinteger("Go to puzzle", "Go to which puzzle number")
         if in_num is not None:
+            size = len(self.game.get_collection(self.file_name))
+            if not 1 <= in_num <= size:
+                messagebox.showerror("Go to puzzle", "The collection has puzzles 1 to {}".format(size))
+                return
             self.puzzle_num = in_num - 1
             self.game.load_puzzle(self.file_name, self.puzzle_num)
             self.__draw_puzzle()
@@ -1794,6 +3470,8 @@ class SudokuUI(tk.Frame):
         self.__draw_puzzle()
 
     def __next_puzzle(self):
+        if self.puzzle_num + 1 >= len(self.game.get_collection(self.file_name)):
+            return
         self.puzzle_num += 1
         self.game.load_puzzle(self.file_name, self.puzzle_num)
         self.__draw_puzzle()
@@ -1803,7 +3481,8 @@ class SudokuUI(tk.Frame):
         self.__draw_puzzle()
 
     def __calculate_candidates(self, event=None):
-        self.game.calculate_all_candidates()
+        self.game.calculate_all_candidates(undo=False)
+        self.__end_move()
         self.__draw_puzzle()
 
     def __toggle_highlight(self, event):
@@ -1820,6 +3499,11 @@ class SudokuUI(tk.Frame):
         self.__draw_puzzle()
 
     def __to_origin(self):
+        solutions = self.game.count_solutions()
+        if solutions != 1:
+            problem = "has no solution" if solutions == 0 else "has more than one solution"
+            if not messagebox.askyesno("Set Origin", "This puzzle {}, use it anyway?".format(problem)):
+                return
         self.game.current_to_origin()
         self.__draw_puzzle()
 
@@ -1842,88 +3526,158 @@ class SudokuUI(tk.Frame):
         self.__draw_puzzle()
 
     def __canvas_resize(self, event):
-        base = min(event.width, event.height)
+        # Dragging a window corner sends a stream of these, only rescale once it settles
+        if self.resize_job is not None:
+            self.after_cancel(self.resize_job)
+        self.resize_job = self.after(RESIZE_DELAY, self.__rescale, event.width, event.height)
+
+    def __rescale(self, width: int, height: int):
+        self.resize_job = None
+        base = min(width, height)
+        side = (base - 2 * self.margin) // 9
+        if side == self.side or side < 1:
+            return
 
-        self.side = (base - 2 * self.margin) // 9 
+        self.side = side
         self.width = self.height = self.margin * 2 + self.side * 9 # Width and height of the whole board
         self.cluesize = self.side // 2
         self.candidatesize = self.side // 4
         self.candidatediff = self.side // 3
 
-        self.__draw_grid()
-        self.__draw_puzzle()
+        self.__layout_items()
         self.__draw_cursor()
 
-    def __draw_grid(self):
+    def __create_items(self):
         """
-        Draws grid divided with blue lines into 3x3 squares
+        Creates the (hidden) canvas items of every cell, the puzzle info and
+        the cursor. Drawing after this only configures them.
         """
-        self.canvas.delete("grid")
+        self.clue_font = tkinter.font.Font(family="Arial", size=self.cluesize)
+        self.candidate_font = tkinter.font.Font(family="Arial", size=self.candidatesize)
+        # Grid divided with dark lines into 3x3 squares, a vertical and a horizontal line per step
+        self.grid_lines = []
         for i in range(10):
             color = "gray22" if i % 3 == 0 else "gray70"
+            self.grid_lines.append(self.canvas.create_line(0, 0, 0, 0, fill=color, width=1, tags="grid"))
+            self.grid_lines.append(self.canvas.create_line(0, 0, 0, 0, fill=color, width=1, tags="grid"))
+        self.cell_items = []
+        for index in range(81):
+            highlight = self.canvas.create_rectangle(0, 0, 0, 0, state=tk.HIDDEN, tags="highlights")
+            colouring = self.canvas.create_rectangle(0, 0, 0, 0, state=tk.HIDDEN, tags="cellcolouring")
+            ovals = [self.canvas.create_oval(0, 0, 0, 0, state=tk.HIDDEN, tags="candidatecolour") for candidate in range(9)]
+            texts = [self.canvas.create_text(0, 0, text=candidate, state=tk.HIDDEN, tags="candidates", fill="gray", font=self.candidate_font)
+                     for candidate in range(1, 10)]
+            number = self.canvas.create_text(0, 0, state=tk.HIDDEN, tags="numbers", font=self.clue_font)
+            self.cell_items.append((highlight, colouring, number, ovals, texts))
+        # Matches the items as created: nothing shown
+        self.cell_states = [(None, None, 0, None, 0, (None,) * 9)] * 81
+        self.info_item = self.canvas.create_text(0, 0, tags="puzzleinfo", fill="gray", font=("Arial", 12))
+        self.hint_item = self.canvas.create_text(0, 0, tags="hint", fill="gray", font=("Arial", 12))
+        self.cursor_item = self.canvas.create_rectangle(0, 0, 0, 0, state=tk.HIDDEN, tags="cursor", width=3)
+        self.__layout_items()
+
+    def __layout_items(self):
+        """
+        Moves every item to where it belongs for the current size
+        """
+        self.clue_font.configure(size=self.cluesize)
+        self.candidate_font.configure(size=self.candidatesize)
+        for i in range(10):
+            offset = self.margin + i * self.side
+            self.canvas.coords(self.grid_lines[i * 2], offset, self.margin, offset, self.height - self.margin)
+            self.canvas.coords(self.grid_lines[i * 2 + 1], self.margin, offset, self.width - self.margin, offset)
+        diff = self.candidatediff / 2 - 1
+        for index, (highlight, colouring, number, ovals, texts) in enumerate(self.cell_items):
+            i, j = CELLS[index]
+            x0 = self.margin + j * self.side + 1
+            y0 = self.margin + i * self.side + 1
+            x1 = self.margin + (j + 1) * self.side - 1
+            y1 = self.margin + (i + 1) * self.side - 1
+            self.canvas.coords(highlight, x0, y0, x1, y1)
+            self.canvas.coords(colouring, x0, y0, x1, y1)
+            self.canvas.coords(number, self.margin + j * self.side + self.side / 2, self.margin + i * self.side + self.side / 2)
+            for candidate in range(1, 10):
+                x, y = self.__get_candidate_pos(i, j, candidate)
+                self.canvas.coords(texts[candidate - 1], x, y)
+                self.canvas.coords(ovals[candidate - 1], x - diff, y - diff, x + diff, y + diff)
+        self.canvas.coords(self.info_item, self.width / 2, self.height - self.margin / 2)
+        self.canvas.coords(self.hint_item, self.width / 2, self.margin / 2)
+
+    def __draw_cell(self, index: int):
+        """
+        Brings the items of one cell up to date, only touching what changed
+        """
+        i, j = CELLS[index]
+        answer = self.game.get_cell(i, j)
+        mask = 0 if answer != 0 else self.game.get_candidate_mask(i, j)
+
+        # The highlight is drawn under the candidates or else they won't be visible
+        highlight = None
+        if self.highlight != 0 and self.mode is not Mode.colour_candidate:
+            if answer == self.highlight:
+                highlight = HLANSWER
+            elif answer == 0 and mask & DIGIT_BITS[self.highlight]:
+                highlight = HLCAND
+
+        colour = self.game.get_cell_colour(i, j) if answer == 0 else None
+        number_colour = None
+        if answer != 0:
+            number_colour = "black" if answer == self.game.get_origin(i, j) else "olive drab"
+        candidate_colours = tuple(
+            self.game.get_candidate_colour(i, j, candidate) if mask & DIGIT_BITS[candidate] else None
+            for candidate in range(1, 10)
+        )
+
+        state = (highlight, colour, answer, number_colour, mask, candidate_colours)
+        old = self.cell_states[index]
+        if state == old:
+            return
+        self.cell_states[index] = state
+        highlight_item, colouring_item, number_item, ovals, texts = self.cell_items[index]
 
-            x0 = self.margin + i * self.side
-            y0 = self.margin
-            x1 = self.margin + i * self.side
-            y1 = self.height - self.margin
-            self.canvas.create_line(x0, y0, x1, y1, fill=color, width=1, tags="grid")
+        if highlight != old[0]:
+            if highlight is None:
+                self.canvas.itemconfigure(highlight_item, state=tk.HIDDEN)
+            else:
+                self.canvas.itemconfigure(highlight_item, state=tk.NORMAL, fill=highlight, outline=highlight)
+        if colour != old[1]:
+            if colour is None:
+                self.canvas.itemconfigure(colouring_item, state=tk.HIDDEN)
+            else:
+                self.canvas.itemconfigure(colouring_item, state=tk.NORMAL, fill=colour, outline=colour)
+        if (answer, number_colour) != old[2:4]:
+            if answer == 0:
+                self.canvas.itemconfigure(number_item, state=tk.HIDDEN)
+            else:
+                self.canvas.itemconfigure(number_item, state=tk.NORMAL, text=answer, fill=number_colour)
+        for candidate in range(9):
+            if (mask ^ old[4]) >> candidate & 1:
+                self.canvas.itemconfigure(texts[candidate], state=tk.NORMAL if mask >> candidate & 1 else tk.HIDDEN)
+            candidate_colour = candidate_colours[candidate]
+            if candidate_colour != old[5][candidate]:
+                if candidate_colour is None:
+                    self.canvas.itemconfigure(ovals[candidate], state=tk.HIDDEN)
+                else:
+                    self.canvas.itemconfigure(ovals[candidate], state=tk.NORMAL, fill=candidate_colour, outline=candidate_colour)
 
-            x0 = self.margin
-            y0 = self.margin + i * self.side
-            x1 = self.width - self.margin
-            y1 = self.margin + i * self.side
-            self.canvas.create_line(x0, y0, x1, y1, fill=color, width=1, tags="grid")
+    def __end_move(self):
+        # The singles a move leaves are filled in as part of it, so undo takes
+        # both back. Only moves do this, an undo or redo leaves them alone.
+        if self.autosolve_naked_singles.get():
+            self.game.propagate_singles(undo=False)
+        self.game.save_undo_state()
 
     def __draw_puzzle(self):
-        self.canvas.delete("numbers")
-        self.canvas.delete("candidates")
-        self.canvas.delete("highlights")
-        self.canvas.delete("puzzleinfo")
-        self.canvas.delete("cellcolouring")
-        self.canvas.delete("candidatecolour")
-        self.canvas.delete("hint")
-        for i in range(9):
-            for j in range(9):
-                x0 = self.margin + j * self.side + 1
-                y0 = self.margin + i * self.side + 1
-                x1 = self.margin + (j + 1) * self.side - 1
-                y1 = self.margin + (i + 1) * self.side - 1
-                answer = self.game.get_cell(i,j)
-                candidates = self.game.get_candidates(i,j)
-
-                # First draw the highlight or else the candidates won't be visible
-                do_highlight = True
-                if self.highlight == 0 or self.mode is Mode.colour_candidate:
-                    do_highlight = False
-
-                if do_highlight and answer == self.highlight:
-                    self.canvas.create_rectangle(x0, y0, x1, y1, tags="highlights", fill=HLANSWER, outline=HLANSWER)
-                elif do_highlight and self.highlight in candidates and answer == 0:
-                    self.canvas.create_rectangle(x0, y0, x1, y1, tags="highlights", fill=HLCAND, outline=HLCAND)
-
-                # Then draw cell colouring
-                colour = self.game.get_cell_colour(i,j)
-                if not colour is None and answer == 0:
-                    self.canvas.create_rectangle(x0, y0, x1, y1, tags="cellcolouring", fill=colour , outline=colour)
-
-                if answer != 0:
-                    # Draw big character
-                    x = self.margin + j * self.side + self.side / 2
-                    y = self.margin + i * self.side + self.side / 2
-                    original = self.game.get_origin(i, j)
-                    color = "black" if answer == original else "olive drab"
-                    self.canvas.create_text(x,y, text=answer, tags="numbers", fill=color, font=("Arial",self.cluesize))
-                else:
-                    # Draw candidate colouring
-                    for candidate in candidates:
-                        self.__draw_candidate_colour(i, j, candidate)
-                    # Draw candidates
-                    for candidate in candidates:
-                        self.__draw_candidate(i, j, candidate)
+        changed = self.game.pop_changed_cells()
+        # Highlighting touches every cell, otherwise only redraw what the game changed
+        drawn_highlight = (self.highlight, self.mode is Mode.colour_candidate)
+        if drawn_highlight != self.drawn_highlight:
+            self.drawn_highlight = drawn_highlight
+            changed = range(81)
+        for index in changed:
+            self.__draw_cell(index)
 
         # Write puzzle info in the middle bottom of the puzzle
-        pix = self.width / 2
-        piy = self.height - self.margin / 2
         puzzle_info = ""
         if self.file_name != "":
             collection_name = self.file_name.split("/")[-1].split(".")[-2]
@@ -1931,17 +3685,13 @@ class SudokuUI(tk.Frame):
                 puzzle_info = collection_name
             else:
                 puzzle_info = "{}: {}".format(collection_name, self.puzzle_num + 1)
-        self.canvas.create_text(pix, piy, text=puzzle_info, tags="puzzleinfo", fill="gray", font=("Arial", 12))
+        self.canvas.itemconfigure(self.info_item, text=puzzle_info)
 
         # Write the name of the Technique that was hinted in the top middle
-        piy = self.margin / 2
-        puzzle_info = "Hint: {}".format(self.technique)
+        hint_info = ""
         if self.technique != "":
-            self.canvas.create_text(pix, piy, text=puzzle_info, tags="hint", fill="gray", font=("Arial", 12))
-
-        # If we're autosolving singles, check once more
-        if self.autosolve_naked_singles.get():
-            self.__autofill_naked_singles()
+            hint_info = "Hint: {}".format(self.technique)
+        self.canvas.itemconfigure(self.hint_item, text=hint_info)
 
     def __get_candidate_pos(self, row: int, col: int, candidate: int) -> Tuple[float, float]:
         diff = self.candidatediff
@@ -1977,23 +3727,6 @@ class SudokuUI(tk.Frame):
 
         return x, y
 
-
-    def __draw_candidate(self, row: int, col: int, candidate: int):
-        x,y = self.__get_candidate_pos(row, col, candidate)
-        self.canvas.create_text(x,y, text=candidate, tags="candidates", fill="gray", font=("Arial", self.candidatesize))
-
-    def __draw_candidate_colour(self, row: int, col: int, candidate: int):
-        diff = self.candidatediff / 2 - 1
-        colour = self.game.get_candidate_colour(row, col, candidate)
-        if colour is None:
-            return
-        x,y = self.__get_candidate_pos(row, col, candidate)
-        x0 = x - diff
-        x1 = x + diff
-        y0 = y - diff
-        y1 = y + diff
-        self.canvas.create_oval(x0, y0, x1, y1, tags="candidatecolour", fill=colour, outline=colour)
-
     def __clear_answers(self):
         self.game.start()
         self.canvas.delete("victory")
@@ -2021,7 +3754,6 @@ class SudokuUI(tk.Frame):
         self.__draw_cursor()
 
     def __cursor_left(self, event):
-        self.canvas.delete("cursor")
         if self.__deselected():
             self.row = 0
             self.col = 8
@@ -2033,7 +3765,6 @@ class SudokuUI(tk.Frame):
         self.__draw_cursor()
 
     def __cursor_right(self, event):
-        self.canvas.delete("cursor")
         if self.__deselected():
             self.row = 0
             self.col = 0
@@ -2045,7 +3776,6 @@ class SudokuUI(tk.Frame):
         self.__draw_cursor()
 
     def __cursor_up(self, event):
-        self.canvas.delete("cursor")
         if self.__deselected():
             self.row = 8
             self.col = 0
@@ -2057,7 +3787,6 @@ class SudokuUI(tk.Frame):
         self.__draw_cursor()
 
     def __cursor_down(self, event):
-        self.canvas.delete("cursor")
         if self.__deselected():
             self.row = 0
             self.col = 0
@@ -2075,7 +3804,6 @@ class SudokuUI(tk.Frame):
             return False
 
     def __draw_cursor(self):
-        self.canvas.delete("cursor")
         if self.row >= 0 and self.col >= 0:
             x0 = self.margin + self.col * self.side + 1
             y0 = self.margin + self.row * self.side + 1
@@ -2092,7 +3820,11 @@ class SudokuUI(tk.Frame):
                 color = "yellow3"
             else:
                 color = "pink"
-            self.canvas.create_rectangle(x0, y0, x1, y1, outline=color, tags="cursor", width=3)
+            self.canvas.coords(self.cursor_item, x0, y0, x1, y1)
+            self.canvas.itemconfigure(self.cursor_item, state=tk.NORMAL, outline=color)
+            self.canvas.tag_raise(self.cursor_item)
+        else:
+            self.canvas.itemconfigure(self.cursor_item, state=tk.HIDDEN)
 
     def __key_pressed(self, event):
         if self.game.game_over:
@@ -2100,11 +3832,13 @@ class SudokuUI(tk.Frame):
 
         if self.row >= 0 and self.col >= 0 and event.char in "1234567890":
             if self.mode is Mode.solution and self.game.get_origin(self.row,self.col) == 0:
-                self.game.set_cell(self.row, self.col, int(event.char))
+                self.game.set_cell(self.row, self.col, int(event.char), undo=False)
+                self.__end_move()
             elif self.game.get_origin(self.row,self.col) != 0:
                 self.highlight = int(event.char)
             elif self.mode is Mode.candidate:
-                self.game.toggle_candidate(self.row, self.col, int(event.char))
+                self.game.toggle_candidate(self.row, self.col, int(event.char), undo=False)
+                self.__end_move()
             elif self.mode is Mode.colour:
                 self.game.set_cell_colour(self.row, self.col,int(event.char))
             elif self.mode is Mode.colour_candidate and self.game.get_origin(self.row,self.col) != 0:
@@ -2149,7 +3883,9 @@ class SudokuUI(tk.Frame):
         self.__draw_puzzle()
 
 
-if __name__ == '__main__':
+def run_gui():
+    if tk is None:
+        sys.exit("The game needs tkinter, the commands (see --help) work without it")
     game = SudokuGame()
     game.start()
 
@@ -2157,3 +3893,199 @@ if __name__ == '__main__':
     SudokuUI(root,game)
     root.geometry("{}x{}".format(WIDTH, HEIGHT))
     root.mainloop()
+
+def cmd_solve(args: argparse.Namespace):
+    out = sys.stdout if args.output is None else open(args.output, "w")
+    try:
+        count, seconds = batch_solve(args.file, out, args.processes, args.chunk_size)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    rate = count / seconds if seconds > 0 else 0.0
+    print("Solved {} puzzles in {:.2f}s ({:.0f} puzzles/sec)".format(count, seconds, rate), file=sys.stderr)
+
+def cmd_rate(args: argparse.Namespace):
+    out = sys.stdout if args.output is None else open(args.output, "w")
+    stats = EngineStats() if args.stats else None
+    try:
+        difficulties, seconds = batch_rate(args.files, out, args.processes, args.chunk_size, stats)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if stats is not None:
+        with open(args.stats, "w") as file:
+            file.write(stats.to_json() + "\n")
+    count = sum(difficulties.values())
+    rate = count / seconds if seconds > 0 else 0.0
+    summary = ", ".join("{} {}".format(name, difficulties[name]) for name in ("Easy", "Medium", "Hard", "Unfair", "Extreme"))
+    print("Rated {} puzzles in {:.2f}s ({:.0f} puzzles/sec): {}".format(count, seconds, rate, summary), file=sys.stderr)
+
+def cmd_generate(args: argparse.Namespace):
+    out = sys.stdout if args.output is None else open(args.output, "w")
+    try:
+        stats = batch_generate(args.difficulty, args.count, out, args.symmetric, args.processes, args.chunk_size)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    for difficulty, (found, attempts, seconds) in stats.items():
+        rate = found / seconds * 60 if seconds > 0 else 0.0
+        print("{}: {} puzzles from {} attempts in {:.2f}s ({:.1f} puzzles/min)".format(difficulty, found, attempts, seconds, rate), file=sys.stderr)
+
+def cmd_bench(args: argparse.Namespace):
+    file_names = args.files or [file_name for file_name in BENCHMARK_FILES if os.path.exists(file_name)]
+    results = benchmark(file_names, args.sample, args.rounds)
+    text = json.dumps(results, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as out:
+            out.write(text + "\n")
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare_benchmark(results, baseline, args.threshold, args.metric)
+        for regression in regressions:
+            print("Slower than baseline, " + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+def cmd_candidates(args: argparse.Namespace):
+    check_numpy()
+    start = time.perf_counter()
+    givens = load_givens(args.file)
+    arrays = {"givens": givens}
+    if args.singles:
+        arrays["values"], masks = batch_propagate_singles(givens)
+    else:
+        masks = batch_candidates(givens)
+    arrays["candidates"] = masks_to_boolean(masks) if args.boolean else masks
+    seconds = time.perf_counter() - start
+    np.savez_compressed(args.output, **arrays)
+    print("Computed the candidates of {} puzzles in {:.2f}s".format(len(givens), seconds), file=sys.stderr)
+
+def cmd_dedup(args: argparse.Namespace):
+    start = time.perf_counter()
+    clusters, count = find_duplicates(args.files, args.processes, buckets=args.buckets)
+    out = sys.stdout if args.output is None else open(args.output, "w")
+    try:
+        for members in clusters:
+            out.write(" ".join("{}:{}".format(args.files[file_number], number + 1) for file_number, number in members) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.unique is not None:
+        # Keep the first puzzle of every cluster
+        dropped = set(member for members in clusters for member in members[1:])
+        with open(args.unique, "w") as out:
+            for file_number, file_name in enumerate(args.files):
+                for number, puzzle in enumerate(puzzle for puzzle in iter_collection(file_name) if puzzle):
+                    if (file_number, number) not in dropped:
+                        out.write(puzzle + "\n")
+
+    duplicates = sum(len(members) - 1 for members in clusters)
+    print("{} puzzles, {} duplicates in {} clusters, {:.2f}s".format(count, duplicates, len(clusters), time.perf_counter() - start), file=sys.stderr)
+
+def cmd_convert(args: argparse.Namespace):
+    """
+    Packs a text collection into .sdb, or unpacks any collection to text
+    """
+    start = time.perf_counter()
+    puzzles = [puzzle for puzzle in iter_collection(args.source) if puzzle]
+    if args.target.endswith(".sdb"):
+        ratings = None
+        solutions = None
+        chunks = list(read_chunks(puzzles, 64))
+        processes = args.processes or multiprocessing.cpu_count()
+        pool = worker_pool(processes) if args.rate or args.solve else None
+        try:
+            if args.rate:
+                ratings = [rating.score if rating.solved else None
+                           for results in map_chunks(rate_chunk, chunks, processes, pool)
+                           for rating in results]
+            if args.solve:
+                solutions = [result if result[0].isdigit() else None
+                             for results in map_chunks(solve_chunk, chunks, processes, pool)
+                             for result in results]
+        finally:
+            if pool is not None:
+                pool.terminate()
+        count = write_binary_collection(puzzles, args.target, ratings, solutions)
+    else:
+        blank = "." if args.target.endswith(".seed") else "0"
+        with open(args.target, "w") as out:
+            for puzzle in puzzles:
+                out.write(puzzle.replace(".", "0").replace("0", blank) + "\n")
+        count = len(puzzles)
+    print("Converted {} puzzles in {:.2f}s".format(count, time.perf_counter() - start), file=sys.stderr)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="sudoku", description="Simple sudoku, starts the GUI when no command is given")
+    commands = parser.add_subparsers(dest="command")
+
+    solve = commands.add_parser("solve", help="solve every puzzle in a .sdm or .seed collection")
+    solve.add_argument("file")
+    solve.add_argument("-o", "--output", help="write the results here instead of stdout")
+    solve.add_argument("-j", "--processes", type=int, default=0, help="worker processes (default: one per core)")
+    solve.add_argument("--chunk-size", type=int, default=256, help="puzzles handed to a worker at a time")
+    solve.set_defaults(func=cmd_solve)
+
+    rate = commands.add_parser("rate", help="rate the difficulty of every puzzle in one or more collections")
+    rate.add_argument("files", nargs="+")
+    rate.add_argument("-o", "--output", help="write the ratings here instead of stdout")
+    rate.add_argument("-j", "--processes", type=int, default=0, help="worker processes (default: one per core)")
+    rate.add_argument("--chunk-size", type=int, default=32, help="puzzles handed to a worker at a time")
+    rate.add_argument("--stats", help="write the engine counters per technique, of all workers together, to this JSON file")
+    rate.set_defaults(func=cmd_rate)
+
+    generate = commands.add_parser("generate", help="generate new puzzles of the given difficulties")
+    generate.add_argument("-d", "--difficulty", nargs="+", choices=DIFFICULTIES, default=["Medium"])
+    generate.add_argument("-n", "--count", type=int, default=10, help="puzzles to generate for every difficulty")
+    generate.add_argument("-s", "--symmetric", action="store_true", help="keep the clues symmetric through the centre")
+    generate.add_argument("-o", "--output", help="write the puzzles here instead of stdout")
+    generate.add_argument("-j", "--processes", type=int, default=0, help="worker processes (default: one per core)")
+    generate.add_argument("--chunk-size", type=int, default=4, help="attempts handed to a worker at a time")
+    generate.set_defaults(func=cmd_generate)
+
+    bench = commands.add_parser("bench", help="time the candidates, get_hint and every hint technique on sample puzzles")
+    bench.add_argument("files", nargs="*", help="collections to sample (default: the bundled .seed and .sdm files)")
+    bench.add_argument("-n", "--sample", type=int, default=50, help="puzzles taken from every collection")
+    bench.add_argument("--rounds", type=int, default=3, help="times every puzzle is timed, the fastest counts")
+    bench.add_argument("-o", "--output", help="write the JSON results here instead of stdout")
+    bench.add_argument("--baseline", help="earlier results to compare with, exits with 1 if anything got slower")
+    bench.add_argument("--threshold", type=float, default=1.25, help="how many times slower than the baseline is too slow")
+    bench.add_argument("--metric", choices=("mean", "p50", "p90", "p99", "max"), default="p50", help="the timing compared with the baseline")
+    bench.set_defaults(func=cmd_bench)
+
+    candidates = commands.add_parser("candidates", help="compute the candidates of a whole collection at once (needs numpy)")
+    candidates.add_argument("file")
+    candidates.add_argument("-o", "--output", required=True, help=".npz file for the givens, candidates and with --singles the values")
+    candidates.add_argument("--singles", action="store_true", help="fill in naked and hidden singles first")
+    candidates.add_argument("--boolean", action="store_true", help="store the candidates as (N, 81, 9) booleans instead of (N, 81) masks")
+    candidates.set_defaults(func=cmd_candidates)
+
+    dedup = commands.add_parser("dedup", help="find puzzles that are the same up to symmetry, over one or more collections")
+    dedup.add_argument("files", nargs="+")
+    dedup.add_argument("-o", "--output", help="write the duplicate clusters here instead of stdout, one file:number list per line")
+    dedup.add_argument("--unique", help="write every puzzle once, the first one of each cluster, to this file")
+    dedup.add_argument("-j", "--processes", type=int, default=0, help="worker processes (default: one per core)")
+    dedup.add_argument("--buckets", type=int, default=64, help="temporary files the hashes are spread over, more means less memory")
+    dedup.set_defaults(func=cmd_dedup)
+
+    convert = commands.add_parser("convert", help="convert between .sdm/.seed and the packed .sdb collection format")
+    convert.add_argument("source")
+    convert.add_argument("target", help="a .sdb target is packed, anything else is written as text")
+    convert.add_argument("--rate", action="store_true", help="store the rating of every puzzle in the .sdb")
+    convert.add_argument("--solve", action="store_true", help="store the solution of every puzzle in the .sdb")
+    convert.add_argument("-j", "--processes", type=int, default=0, help="worker processes (default: one per core)")
+    convert.set_defaults(func=cmd_convert)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        run_gui()
+    else:
+        args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,709 @@
+import os
+import tempfile
+import unittest
+
+import sudoku
+from sudoku import SudokuGame, UndoLog
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EASY = open(os.path.join(HERE, "Easy.seed")).readline().strip()
+EASY_SOLUTION = "789235641652491738134678592913567824846923175275814369527146983468359217391782456"
+EXTREME = open(os.path.join(HERE, "Extreme.seed")).readline().strip()
+EXTREME_SOLUTION = "578921364243675189916834752135248697869317425427596813692483571784159236351762948"
+HARD = open(os.path.join(HERE, "Hard.seed")).readline().strip()
+
+
+def filled(game: SudokuGame) -> int:
+    return sum(1 for row in range(9) for col in range(9) if game.get_cell(row, col) != 0)
+
+
+def empty_cell(game: SudokuGame):
+    return next((row, col) for row in range(9) for col in range(9)
+                if game.get_cell(row, col) == 0 and len(game.get_candidates(row, col)) > 1)
+
+
+class UndoTest(unittest.TestCase):
+    def setUp(self):
+        self.game = SudokuGame()
+        self.game.from_string(EASY)
+        self.game.calculate_all_candidates()
+        self.game.save_undo_state()
+
+    def test_undo_redo_cell(self):
+        game = self.game
+        row, col = empty_cell(game)
+        digit = game.get_candidates(row, col)[0]
+        before = game.get_state()
+        game.set_cell(row, col, digit)
+        after = game.get_state()
+        game.undo()
+        self.assertEqual(game.get_state(), before)
+        game.redo()
+        self.assertEqual(game.get_state(), after)
+
+    def test_transaction(self):
+        game = self.game
+        before = game.get_state()
+        row, col = empty_cell(game)
+        for digit in game.get_candidates(row, col):
+            game.remove_candidate(row, col, digit, undo=False)
+        game.set_cell_colour(row, col, 2, undo=False)
+        game.save_undo_state()
+        game.undo()
+        self.assertEqual(game.get_state(), before)
+        self.assertEqual(game.get_cell_colour(row, col), None)
+
+    def test_new_move_clears_redo(self):
+        game = self.game
+        row, col = empty_cell(game)
+        game.toggle_candidate(row, col, 1)
+        game.undo()
+        game.toggle_candidate(row, col, 2)
+        state = game.get_state()
+        game.redo()
+        self.assertEqual(game.get_state(), state)
+
+    def test_reset_colours_records_only_set_colours(self):
+        game = self.game
+        game.set_cell_colour(0, 0, 3)
+        game.set_candidate_colour(4, 4, 5, 2)
+        game.reset_colours()
+        game.save_undo_state()
+        self.assertEqual(len(game.undo_log.done[-1]), 2)
+        game.undo()
+        self.assertEqual(game.get_cell_colour(0, 0), sudoku.COLOURS[3])
+        self.assertEqual(game.get_candidate_colour(4, 4, 5), sudoku.COLOURS[2])
+
+    def test_limit_counts_cells(self):
+        log = UndoLog(200)
+        log.record((UndoLog.REPLACE, "colours", [[0] * 9 for row in range(9)], [[1] * 9 for row in range(9)]))
+        log.commit()
+        self.assertEqual(log.size, 162)
+        for index in range(50):
+            log.record((UndoLog.COLOUR, index, 0, 1))
+            log.commit()
+        self.assertEqual(len(log.done), 50)
+        self.assertEqual(log.size, 50)
+
+    def test_autosolve_undo(self):
+        # What the game does with autosolve on: the singles go with the move
+        game = self.game
+        start = filled(game)
+        row, col = empty_cell(game)
+        game.set_cell(row, col, game.get_candidates(row, col)[0], undo=False)
+        self.assertGreater(game.propagate_singles(undo=False), 0)
+        game.save_undo_state()
+        after = game.get_state()
+        game.undo()
+        self.assertEqual(filled(game), start)
+        self.assertEqual(game.get_cell(row, col), 0)
+        game.redo()
+        self.assertEqual(game.get_state(), after)
+
+
+def board_string(board: sudoku.SudokuBoard) -> str:
+    return "".join(str(digit) for row in board.get() for digit in row)
+
+
+class SolverTest(unittest.TestCase):
+    def test_solve(self):
+        self.assertEqual(sudoku.SudokuSolver(EASY).solve(), EASY_SOLUTION)
+        self.assertEqual(sudoku.SudokuSolver(EXTREME).solve(), EXTREME_SOLUTION)
+
+    def test_solve_board(self):
+        grid = sudoku.parse_puzzle(EXTREME)
+        self.assertEqual(sudoku.SudokuSolver(grid).solve(), EXTREME_SOLUTION)
+        self.assertEqual(sudoku.SudokuSolver(sudoku.SudokuBoard(EXTREME)).solve(), EXTREME_SOLUTION)
+
+    def test_unique(self):
+        self.assertTrue(sudoku.SudokuSolver(EXTREME).is_unique())
+        self.assertEqual(sudoku.SudokuSolver("." * 81).count_solutions(5), 5)
+        self.assertEqual(sudoku.SudokuSolver("11" + "." * 79).count_solutions(), 0)
+
+    def test_solve_puzzle_string(self):
+        self.assertEqual(sudoku.solve_puzzle_string(EXTREME), EXTREME_SOLUTION)
+        self.assertEqual(sudoku.solve_puzzle_string("." * 81), "multiple")
+        self.assertEqual(sudoku.solve_puzzle_string("11" + "." * 79), "unsolved")
+        self.assertEqual(sudoku.solve_puzzle_string("abc"), "invalid")
+        self.assertEqual(sudoku.solve_puzzle_string(EXTREME + "1"), "invalid")
+        self.assertEqual(sudoku.solve_puzzle_string(EXTREME + "\n"), EXTREME_SOLUTION)
+
+    def test_game_count_solutions(self):
+        game = SudokuGame()
+        game.from_string(EXTREME)
+        self.assertEqual(game.count_solutions(), 1)
+
+    def test_batch_solve(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "puzzles.sdm")
+            with open(file_name, "w") as file:
+                file.write("{}\n{}\n{}\n".format(EASY, "." * 81, EXTREME))
+            out = os.path.join(directory, "solutions.txt")
+            with open(out, "w") as file:
+                count, seconds = sudoku.batch_solve(file_name, file, processes=1)
+            self.assertEqual(count, 3)
+            self.assertEqual(open(out).read().split(), [EASY_SOLUTION, "multiple", EXTREME_SOLUTION])
+
+
+class BinaryCollectionTest(unittest.TestCase):
+    def test_pack(self):
+        digits = bytes(int(ch) if ch != "." else 0 for ch in EXTREME)
+        packed = sudoku.pack_puzzle(digits)
+        self.assertEqual(len(packed), sudoku.PACKED_SIZE)
+        self.assertEqual(sudoku.unpack_puzzle(packed), digits)
+
+    def test_round_trip(self):
+        puzzles = [EASY.replace(".", "0"), EXTREME.replace(".", "0")]
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "puzzles.sdb")
+            sudoku.write_binary_collection(puzzles, file_name, ratings=[2.3, None], solutions=[EASY_SOLUTION, None])
+            collection = sudoku.open_collection(file_name)
+            self.assertIsInstance(collection, sudoku.BinaryCollection)
+            self.assertEqual(len(collection), 2)
+            self.assertEqual([collection.get(number) for number in range(2)], puzzles)
+            self.assertEqual(collection.get_rating(0), 2.3)
+            self.assertIsNone(collection.get_rating(1))
+            self.assertEqual(collection.get_solution(0), EASY_SOLUTION)
+            self.assertIsNone(collection.get_solution(1))
+            collection.close()
+            self.assertEqual(list(sudoku.iter_collection(file_name)), puzzles)
+
+
+class GenerateTest(unittest.TestCase):
+    def test_attempts_are_capped(self):
+        attempts = []
+        generate_puzzle = sudoku.generate_puzzle
+        sudoku.generate_puzzle = lambda difficulty: attempts.append(difficulty)
+        cwd = os.getcwd()
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                os.chdir(directory)
+                game = SudokuGame()
+                game.from_string(EASY)
+                self.assertFalse(game.generate("Extreme"))
+        finally:
+            os.chdir(cwd)
+            sudoku.generate_puzzle = generate_puzzle
+        self.assertEqual(len(attempts), sudoku.GENERATE_ATTEMPTS)
+        self.assertEqual(board_string(game.board).replace("0", "."), EASY)
+
+    def test_from_seeds(self):
+        cwd = os.getcwd()
+        try:
+            os.chdir(HERE)
+            game = SudokuGame()
+            self.assertTrue(game.generate("Hard"))
+        finally:
+            os.chdir(cwd)
+        self.assertTrue(sudoku.SudokuSolver(board_string(game.board)).is_unique())
+
+
+class PuzzleCollectionTest(unittest.TestCase):
+    def test_blank_lines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "puzzles.sdm")
+            with open(file_name, "w") as file:
+                file.write("{}\n  \n{}\n\n".format(EASY, EXTREME))
+            for persist in (False, True):
+                collection = sudoku.PuzzleCollection(file_name, persist)
+                self.assertEqual(len(collection), 2)
+                self.assertEqual(collection.get(0), EASY)
+                self.assertEqual(collection.get(1), EXTREME)
+                collection.close()
+            self.assertEqual(list(sudoku.iter_collection(file_name)), [EASY, EXTREME])
+
+    def test_bundled_collection(self):
+        collection = sudoku.open_collection(os.path.join(HERE, "hard.sdm"))
+        self.assertEqual(len(collection), 100)
+        game = SudokuGame()
+        game.load_puzzle(os.path.join(HERE, "hard.sdm"), 99)
+        self.assertEqual(board_string(game.board).replace("0", "."), collection.get(99).replace("0", "."))
+
+
+@unittest.skipIf(sudoku.np is None, "needs numpy")
+class LoadGivensTest(unittest.TestCase):
+    def test_rows_match_puzzle_numbers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "puzzles.sdm")
+            with open(file_name, "w") as file:
+                file.write("{}\n\n{}\n".format(EASY, EXTREME))
+            givens = sudoku.load_givens(file_name)
+            self.assertEqual(givens.shape, (2, 81))
+            self.assertEqual("".join(map(str, givens[1])).replace("0", "."), EXTREME)
+            self.assertNotIn(file_name, sudoku.SudokuBoard.seed_pools)
+
+    def test_bad_line(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "puzzles.sdm")
+            with open(file_name, "w") as file:
+                file.write("{}\n{}\n{}\n".format(EASY, EASY[:80], EXTREME))
+            with self.assertRaisesRegex(ValueError, "line 2"):
+                sudoku.load_givens(file_name)
+
+
+class CanonicalTest(unittest.TestCase):
+    def test_known_form(self):
+        self.assertEqual(sudoku.canonical_form(EXTREME),
+                         "........1.....2.3...4..5.62..517.8.6..8.......3.4.8....8.2...4.3..7.....6..3...19")
+
+    def test_symmetries(self):
+        form = sudoku.canonical_form(EXTREME)
+        board = sudoku.SudokuBoard(EXTREME)
+        board.rotate90()
+        self.assertEqual(sudoku.canonical_form(board_string(board)), form)
+        board.flip_hor()
+        self.assertEqual(sudoku.canonical_form(board_string(board)), form)
+        relabelled = EXTREME.translate(str.maketrans("123456789", "912345678"))
+        self.assertEqual(sudoku.canonical_form(relabelled), form)
+        self.assertEqual(sudoku.canonical_hash(relabelled), sudoku.canonical_hash(EXTREME))
+        self.assertNotEqual(sudoku.canonical_form(EASY), form)
+
+    def test_form_keeps_solution_count(self):
+        self.assertTrue(sudoku.SudokuSolver(sudoku.canonical_form(EXTREME)).is_unique())
+
+
+class RatingTest(unittest.TestCase):
+    def test_easy(self):
+        self.assertEqual(sudoku.rate_puzzle(EASY), sudoku.Rating(True, 1.5, "Easy", "hidden_single", 56))
+
+    def test_easiest_technique_first(self):
+        # Trying the naked quad before the easier techniques rated this one Unfair
+        puzzle = "...........4.5.62..9.26..3.5.8..3.1..215....7.........78....25.26.9.............9"
+        self.assertEqual(sudoku.rate_puzzle(puzzle), sudoku.Rating(True, 4.0, "Hard", "hidden_triple", 63))
+
+
+def position(puzzle: str, grid: str) -> SudokuGame:
+    """
+    A game at a fixed position: the givens of puzzle, and grid with a digit
+    for every solved cell and the candidates of the others, row by row
+    """
+    game = SudokuGame()
+    game.from_string(puzzle)
+    game.calculate_all_candidates()
+    cells = grid.split()
+    for index, cell in enumerate(cells):
+        row, col = divmod(index, 9)
+        if len(cell) == 1 and game.get_cell(row, col) == 0:
+            game.set_cell(row, col, int(cell), undo=False)
+    for index, cell in enumerate(cells):
+        row, col = divmod(index, 9)
+        if game.get_cell(row, col) == 0:
+            for digit in game.get_candidates(row, col):
+                if str(digit) not in cell:
+                    game.remove_candidate(row, col, digit, undo=False)
+    game.save_undo_state()
+    return game
+
+
+def find_hint(game: SudokuGame, name: str):
+    # Only the one technique, by the name the benchmark reports it under
+    engine = sudoku.HintEngine(game)
+    next(tech for tech in engine.techs if tech.__name__.lstrip("_") == name)()
+    return engine.hint
+
+
+class HintTestCase(unittest.TestCase):
+    def check(self, name, puzzle, grid, technique, eliminations, cells=None):
+        hint = find_hint(position(puzzle, grid), name)
+        self.assertIsNotNone(hint)
+        self.assertEqual(hint.technique, technique)
+        self.assertEqual(sorted(hint.bad_cands), eliminations)
+        if cells is not None:
+            self.assertEqual(sorted(hint.good_cands), cells)
+        # Whatever a hint takes out can't be the answer
+        solution = sudoku.SudokuSolver(puzzle).solve()
+        for row, col, digit in hint.bad_cands:
+            self.assertNotEqual(solution[row * 9 + col], str(digit))
+
+
+class SubsetTest(HintTestCase):
+    def test_naked_triple(self):
+        self.check("naked_triple", HARD, """
+            3689 2    48   46    1456   1456    14568  7     4569
+            5    67   47   8     9      12467   3      126   46
+            6789 679  1    3     24567  24567   24568  25689 4569
+            1267 1567 3    267   2567   2567    9      4     8
+            1678 4    9    67    5678   3       1567   156   2
+            2678 567  2578 1     245678 2456789 567    56    3567
+            4    8    6    279   1237   1279    257    259   579
+            1279 179  27   5     124678 1246789 24678  3     4679
+            2379 3579 257  24679 234678 246789  245678 25689 1
+        """, "Naked triple 4 6 7", [(1, 5, 4), (1, 5, 6), (1, 5, 7), (1, 7, 6)])
+
+    def test_naked_triple_in_column(self):
+        self.check("naked_triple", "69.7..35...1......8..6.2.4...68....3..5.4.........7.82.......6..6......77.852....", """
+            6   9   2   7  1    4    3  5   8
+            4   35  1   39 3589 3589 7  2   6
+            8   35  7   6  35   2    19 4   19
+            2   7   6   8  59   159  4  19  3
+            39  8   5   2  4    139  6  7   19
+            139 134 349 39 6    7    5  8   2
+            139 2   349 14 7    39   8  6   5
+            5   6   349 14 389  389  2  13  7
+            7   13  8   5  2    6    19 139 4
+        """, "Naked triple 1 3 5", [(5, 1, 1), (5, 1, 3)])
+
+    def test_naked_quad(self):
+        self.check("naked_quad", HARD, """
+            3689 2    48   46    1456   1456    14568  7     4569
+            5    67   47   8     9      12467   3      126   46
+            6789 679  1    3     24567  24567   24568  25689 4569
+            1267 1567 3    267   2567   2567    9      4     8
+            1678 4    9    67    5678   3       1567   156   2
+            2678 567  2578 1     245678 2456789 567    56    3567
+            4    8    6    279   1237   1279    257    259   579
+            1279 179  27   5     124678 1246789 24678  3     4679
+            2379 3579 257  24679 234678 246789  245678 25689 1
+        """, "Naked quad 2 5 6 7", [(4, 4, 5), (4, 4, 6), (4, 4, 7), (5, 4, 2), (5, 4, 5), (5, 4, 6), (5, 4, 7), (5, 5, 2), (5, 5, 5), (5, 5, 6), (5, 5, 7)])
+
+    def test_naked_quad_in_column(self):
+        self.check("naked_quad", "69.7..35...1......8..6.2.4...68....3..5.4.........7.82.......6..6......77.852....", """
+            6    9   2   7    1    4    3    5    8
+            34   345 1   39   3589 3589 27   27   6
+            8    35  7   6    35   2    19   4    19
+            2    7   6   8    59   159  4    19   3
+            139  8   5   2    4    139  6    179  19
+            1349 134 349 139  6    7    5    8    2
+            1349 2   349 1349 7    1389 189  6    5
+            5    6   349 1349 389  1389 1289 1239 7
+            7    13  8   5    2    6    19   139  4
+        """, "Naked quad 1 2 8 9", [(1, 6, 2)])
+
+    def test_hidden_triple(self):
+        self.check("hidden_triple", HARD, """
+            3    2    48  46    1    456   4568  7    9
+            5    67   47  8     9    2467  3     1    46
+            6789 679  1   3     2567 24567 24568 2568 456
+            1267 1567 3   267   2567 2567  9     4    8
+            167  4    9   67    8    3     1567  56   2
+            2678 567  278 1     4    9     567   56   3
+            4    8    6   279   3    1     257   259  57
+            1279 179  27  5     267  24678 24678 3    467
+            279  3    5   24679 267  24678 24678 2689 1
+        """, "Hidden triple 2 8 9", [(2, 7, 5), (2, 7, 6), (6, 7, 5), (8, 7, 6)])
+
+    def test_hidden_quad(self):
+        self.check("hidden_quad", "69.7..35...1......8..6.2.4...68....3..5.4.........7.82.......6..6......77.852....", """
+            6      9     24   7    18    148   3      5    18
+            2345   2345  1    349  3589  34589 26789  279  689
+            8      35    7    6    1359  2     19     4    19
+            1249   7     6    8    159   159   1459   19   3
+            1239   8     5    1239 4     1369  1679   179  169
+            1349   134   349  139  13569 7     14569  8    2
+            123459 12345 2349 1349 13789 13489 124589 6    14589
+            123459 6     2349 1349 1389  13489 124589 1239 7
+            7      134   8    5    2     13469 149    139  149
+        """, "Hidden quad 2 6 7 8", [(0, 8, 1), (1, 6, 9), (1, 7, 9), (1, 8, 9)])
+
+
+class FishTest(HintTestCase):
+    def test_xwing(self):
+        self.check("xwings", HARD, """
+            3    2    48  46    156  1456   14568 7    9
+            5    67   47  8     9    12467  3     126  46
+            6789 679  1   3     2567 24567  24568 2568 456
+            1267 1567 3   267   2567 2567   9     4    8
+            167  4    9   67    8    3      1567  156  2
+            2678 567  278 1     4    9      567   56   3
+            4    8    6   279   3    127    257   259  57
+            1279 179  27  5     1267 124678 24678 3    467
+            279  3    5   24679 267  24678  24678 2689 1
+        """, "X-wing in rows: 9", [(8, 0, 9)],
+                   cells=[(2, 0, 9), (2, 1, 9), (7, 0, 9), (7, 1, 9)])
+
+    def test_finned_xwing(self):
+        self.check("finned_xwings", HARD, """
+            3    2    48 46    1    456   4568  7    9
+            5    67   47 8     9    2467  3     1    46
+            6789 679  1  3     2567 24567 24568 2568 456
+            1267 1567 3  267   2567 2567  9     4    8
+            67   4    9  67    8    3     1     56   2
+            268  56   28 1     4    9     7     56   3
+            4    8    6  279   3    1     25    259  57
+            1279 179  27 5     267  24678 2468  3    467
+            279  3    5  24679 267  24678 2468  2689 1
+        """, "Finned X-wing in rows: 7", [(6, 3, 7)],
+                   cells=[(4, 0, 7), (4, 3, 7), (8, 0, 7), (8, 3, 7), (8, 4, 7), (8, 5, 7)])
+
+    def test_sashimi_xwing(self):
+        self.check("finned_xwings", HARD, """
+            3689 2    48   46    1456   1456    14568  7     4569
+            5    67   47   8     9      12467   3      126   46
+            6789 679  1    3     24567  24567   24568  25689 4569
+            1267 1567 3    267   2567   2567    9      4     8
+            1678 4    9    67    5678   3       1567   156   2
+            2678 567  2578 1     245678 2456789 567    56    3567
+            4    8    6    279   1237   1279    257    259   579
+            1279 179  27   5     124678 1246789 24678  3     4679
+            2379 3579 257  24679 234678 246789  245678 25689 1
+        """, "Sashimi X-wing in rows: 1", [(7, 5, 1)],
+                   cells=[(1, 5, 1), (1, 7, 1), (6, 4, 1), (6, 5, 1)])
+
+    def test_swordfish(self):
+        self.check("swordfish", HARD, """
+            3   2   48 46    1   5    468  7   9
+            5   67  47 8     9   2    3    1   46
+            689 69  1  3     67  467  2468 28  5
+            167 167 3  267   5   67   9    4   8
+            67  4   9  67    8   3    1    5   2
+            28  5   28 1     4   9    7    6   3
+            4   8   6  29    3   1    5    29  7
+            19  19  27 5     267 4678 2468 3   46
+            27  3   5  24679 267 4678 2468 289 1
+        """, "Swordfish in columns: 2", [(7, 6, 2), (8, 3, 2), (8, 6, 2), (8, 7, 2)],
+                   cells=[(5, 0, 2), (5, 2, 2), (7, 2, 2), (7, 4, 2), (8, 0, 2), (8, 4, 2)])
+
+    def test_finned_swordfish(self):
+        self.check("finned_swordfish", HARD, """
+            3689 2    48   46    1456   1456    14568  7     4569
+            5    67   47   8     9      12467   3      126   46
+            6789 679  1    3     24567  24567   24568  25689 4569
+            1267 1567 3    267   2567   2567    9      4     8
+            1678 4    9    67    5678   3       1567   156   2
+            2678 567  2578 1     245678 2456789 567    56    3567
+            4    8    6    279   1237   1279    257    259   579
+            1279 179  27   5     124678 1246789 24678  3     4679
+            2379 3579 257  24679 234678 246789  245678 25689 1
+        """, "Finned Swordfish in columns: 9", [(8, 0, 9)],
+                   cells=[(2, 1, 9), (2, 7, 9), (6, 3, 9), (6, 7, 9), (7, 1, 9), (8, 1, 9), (8, 3, 9), (8, 7, 9)])
+
+    def test_sashimi_swordfish(self):
+        self.check("finned_swordfish", HARD, """
+            3    2    48   46    1456   1456    14568  7     4569
+            5    67   47   8     9      12467   3      126   46
+            6789 679  1    3     24567  24567   24568  25689 4569
+            1267 1567 3    267   2567   2567    9      4     8
+            1678 4    9    67    5678   3       1567   156   2
+            2678 567  2578 1     245678 2456789 567    56    3567
+            4    8    6    279   1237   1279    257    259   579
+            1279 179  27   5     124678 1246789 24678  3     4679
+            279  3579 257  24679 234678 246789  245678 25689 1
+        """, "Sashimi Swordfish in columns: 9", [(7, 5, 9), (8, 5, 9)],
+                   cells=[(2, 0, 9), (2, 1, 9), (6, 3, 9), (7, 0, 9), (7, 1, 9), (8, 0, 9), (8, 1, 9), (8, 3, 9)])
+
+    def test_jellyfish(self):
+        self.check("jellyfish", HARD, """
+            3    2    48   46    1456   1456    14568  7     4569
+            5    67   47   8     9      12467   3      126   46
+            6789 679  1    3     24567  24567   24568  25689 4569
+            1267 1567 3    267   2567   2567    9      4     8
+            1678 4    9    67    5678   3       1567   156   2
+            2678 567  2578 1     245678 2456789 567    56    3567
+            4    8    6    279   1237   1279    257    259   579
+            1279 179  27   5     124678 1246789 24678  3     4679
+            279  3579 257  24679 234678 246789  245678 25689 1
+        """, "Jellyfish in columns: 9", [(2, 8, 9), (6, 5, 9), (6, 8, 9), (7, 5, 9), (7, 8, 9), (8, 5, 9)],
+                   cells=[(2, 0, 9), (2, 1, 9), (2, 7, 9), (6, 3, 9), (6, 7, 9), (7, 0, 9), (7, 1, 9), (8, 0, 9), (8, 1, 9), (8, 3, 9), (8, 7, 9)])
+
+    def test_finned_jellyfish(self):
+        self.check("finned_jellyfish", HARD, """
+            3689 2    48   46    1456   1456    14568  7     4569
+            5    67   47   8     9      12467   3      126   46
+            6789 679  1    3     24567  24567   24568  25689 4569
+            1267 1567 3    267   2567   2567    9      4     8
+            1678 4    9    67    5678   3       1567   156   2
+            2678 567  2578 1     245678 2456789 567    56    3567
+            4    8    6    279   1237   1279    257    259   579
+            1279 179  27   5     124678 1246789 24678  3     4679
+            2379 3579 257  24679 234678 246789  245678 25689 1
+        """, "Finned Jellyfish in columns: 1", [(7, 5, 1)],
+                   cells=[(0, 4, 1), (0, 6, 1), (3, 0, 1), (3, 1, 1), (4, 0, 1), (4, 6, 1), (6, 4, 1), (7, 0, 1), (7, 1, 1), (7, 4, 1)])
+
+    def test_sashimi_jellyfish(self):
+        self.check("finned_jellyfish", HARD, """
+            3    2    48  46    156  1456   14568 7     4569
+            5    67   47  8     9    12467  3     126   46
+            6789 679  1   3     2567 24567  24568 25689 4569
+            1267 1567 3   267   2567 2567   9     4     8
+            167  4    9   67    8    3      1567  156   2
+            2678 567  278 1     4    9      567   56    3
+            4    8    6   279   3    127    257   259   579
+            1279 179  27  5     1267 124678 24678 3     4679
+            279  3    5   24679 267  24678  24678 2689  1
+        """, "Sashimi Jellyfish in columns: 1", [(0, 6, 1)],
+                   cells=[(0, 4, 1), (1, 7, 1), (3, 0, 1), (3, 1, 1), (4, 0, 1), (4, 7, 1), (7, 0, 1), (7, 1, 1), (7, 4, 1)])
+
+
+class LinkGraphTest(unittest.TestCase):
+    def test_sync_matches_new_graph(self):
+        game = SudokuGame()
+        game.from_string(EXTREME)
+        game.calculate_all_candidates()
+        game.save_undo_state()
+        links = sudoku.LinkGraph()
+        links.sync(game)
+        for step in range(20):
+            game.apply_hint(sudoku.HintEngine(game).get_hint())
+            if step % 3 == 2:
+                game.undo()
+            links.sync(game)
+            fresh = sudoku.LinkGraph()
+            fresh.sync(game)
+            self.assertEqual(links.strong, fresh.strong)
+            self.assertEqual(links.conjugates, fresh.conjugates)
+
+    def test_snapshot_copies_links(self):
+        game = SudokuGame()
+        game.from_string(EXTREME)
+        game.calculate_all_candidates()
+        game.links = sudoku.LinkGraph()
+        game.links.sync(game)
+        snapshot = game.snapshot()
+        self.assertIsNot(snapshot.links, game.links)
+        self.assertEqual(snapshot.links.strong, game.links.strong)
+        self.assertEqual(snapshot.links.sync(snapshot), 0)
+
+
+class ChainTest(HintTestCase):
+    def test_simple_colouring(self):
+        self.check("simple_colouring", HARD, """
+            3689 2    48   46    1456   1456    14568  7     4569
+            5    67   47   8     9      12467   3      126   46
+            6789 679  1    3     24567  24567   24568  25689 4569
+            1267 1567 3    267   2567   2567    9      4     8
+            1678 4    9    67    5678   3       1567   156   2
+            2678 567  2578 1     245678 2456789 567    56    3567
+            4    8    6    279   1237   1279    257    259   579
+            1279 179  27   5     124678 1246789 24678  3     4679
+            2379 3579 257  24679 234678 246789  245678 25689 1
+        """, "Simple colouring: 1", [(4, 0, 1)])
+
+    def test_x_chains(self):
+        self.check("x_chains", HARD, """
+            3   2   48 46    1    456  4568  7   9
+            5   67  47 8     9    2    3     1   46
+            689 69  1  3     567  4567 24568 28  456
+            167 167 3  267   2567 567  9     4   8
+            67  4   9  67    8    3    1     5   2
+            28  5   28 1     4    9    7     6   3
+            4   8   6  279   3    1    25    29  57
+            19  19  27 5     267  4678 2468  3   467
+            27  3   5  24679 267  4678 2468  289 1
+        """, "X-chain: 7r7c9 = 7r7c4 - 7r5c4 = 7r5c1 - 7r9c1 = 7r8c3", [(7, 8, 7)])
+
+    def test_xy_chains(self):
+        self.check("xy_chains", HARD, """
+            3689 2    48   46    1456   1456    14568  7     4569
+            5    67   47   8     9      12467   3      126   46
+            6789 679  1    3     24567  24567   24568  25689 4569
+            1267 1567 3    267   2567   2567    9      4     8
+            1678 4    9    67    5678   3       1567   156   2
+            2678 567  2578 1     245678 2456789 567    56    3567
+            4    8    6    279   1237   1279    257    259   579
+            1279 179  27   5     124678 1246789 24678  3     4679
+            2379 3579 257  24679 234678 246789  245678 25689 1
+        """, "XY-chain: 6r2c2 = 7r2c2 - 7r2c3 = 4r2c3 - 4r2c9 = 6r2c9", [(1, 5, 6), (1, 7, 6)])
+
+    def test_aic(self):
+        self.check("aic", HARD, """
+            3    2   48 46    1    456  4568  7   9
+            5    67  47 8     9    2    3     1   46
+            689  69  1  3     567  4567 24568 28  456
+            167  167 3  267   2567 567  9     4   8
+            67   4   9  67    8    3    1     5   2
+            28   5   28 1     4    9    7     6   3
+            4    8   6  279   3    1    25    29  57
+            1279 179 27 5     267  4678 2468  3   467
+            27   3   5  24679 267  4678 2468  289 1
+        """, "AIC: 2r8c3 = 7r8c3 - 7r9c1 = 2r9c1", [(7, 0, 2)])
+
+
+class ZobristTest(unittest.TestCase):
+    def assertHashed(self, game: SudokuGame):
+        self.assertEqual(game.zobrist, sudoku.zobrist_hash(game.puzzle, game.candidates))
+
+    def test_kept_in_step(self):
+        game = SudokuGame()
+        game.from_string(EXTREME)
+        self.assertHashed(game)
+        game.calculate_all_candidates()
+        self.assertHashed(game)
+        start = game.zobrist
+        row, col = empty_cell(game)
+        digit = game.get_candidates(row, col)[0]
+        game.set_cell(row, col, digit)
+        self.assertHashed(game)
+        other_row, other_col = empty_cell(game)
+        game.remove_candidate(other_row, other_col, game.get_candidates(other_row, other_col)[0])
+        self.assertHashed(game)
+        game.apply_hint(sudoku.HintEngine(game).get_hint())
+        self.assertHashed(game)
+        after = game.zobrist
+        for step in range(3):
+            game.undo()
+            self.assertHashed(game)
+        self.assertEqual(game.zobrist, start)
+        for step in range(3):
+            game.redo()
+            self.assertHashed(game)
+        self.assertEqual(game.zobrist, after)
+
+    def test_replace(self):
+        game = SudokuGame()
+        game.from_string(EXTREME)
+        game.calculate_all_candidates()
+        state = game.get_state()
+        hashed = game.zobrist
+        # start() puts back whole structures as REPLACE records
+        game.start()
+        self.assertHashed(game)
+        self.assertNotEqual(game.zobrist, hashed)
+        game.undo()
+        self.assertHashed(game)
+        self.assertEqual(game.zobrist, hashed)
+        other = SudokuGame()
+        other.import_state(state)
+        self.assertHashed(other)
+        self.assertEqual(other.zobrist, hashed)
+
+    def test_same_position_same_hash(self):
+        first = SudokuGame()
+        first.from_string(EXTREME)
+        first.calculate_all_candidates()
+        second = SudokuGame()
+        second.from_string(EXTREME)
+        second.calculate_all_candidates()
+        row, col = empty_cell(first)
+        digits = first.get_candidates(row, col)[:2]
+        first.remove_candidate(row, col, digits[0])
+        first.remove_candidate(row, col, digits[1])
+        self.assertNotEqual(first.zobrist, second.zobrist)
+        second.remove_candidate(row, col, digits[1])
+        second.remove_candidate(row, col, digits[0])
+        self.assertEqual(first.zobrist, second.zobrist)
+
+
+class HintCacheTest(unittest.TestCase):
+    def test_find_hint_hits(self):
+        game = SudokuGame()
+        game.from_string(EXTREME)
+        game.calculate_all_candidates()
+        hint = game.find_hint()
+        self.assertIn(game.zobrist, game.hint_cache)
+        self.assertIs(game.find_hint(), hint)
+        game.apply_hint(hint)
+        second = game.find_hint()
+        self.assertEqual(len(game.hint_cache), 2)
+        game.undo()
+        self.assertIs(game.find_hint(), hint)
+        game.redo()
+        self.assertIs(game.find_hint(), second)
+        self.assertEqual(len(game.hint_cache), 2)
+
+    def test_least_recently_used_goes(self):
+        cache = sudoku.HintCache(2)
+        cache.put(1, None)
+        cache.put(2, None)
+        self.assertIsNone(cache.get(1))
+        cache.put(3, None)
+        self.assertEqual(len(cache), 2)
+        self.assertIn(1, cache)
+        self.assertNotIn(2, cache)
+        self.assertIn(3, cache)
+        cache.put(4, None)
+        self.assertNotIn(1, cache)
+        self.assertEqual(len(cache), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()